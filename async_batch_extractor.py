@@ -3,26 +3,82 @@
 异步批量XPath提取工具 - 支持配置文件和CSV导出
 """
 
+from __future__ import annotations
+
 import asyncio
 import json
 import csv
+import hashlib
+import re
+import sqlite3
 import time
 import sys
 import os
 import argparse
-from urllib.parse import urlparse
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Callable, Awaitable
 from datetime import datetime
-import aiohttp
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+
+if TYPE_CHECKING:
+    import aiohttp
 
 # 导入异步XPathExtractor
-from async_xpath_extractor import AsyncXPathExtractor
+from async_xpath_extractor import AsyncXPathExtractor, LLMResponseError, _json_dumps, _json_loads
+from config_manager import _URL_RE
+
+
+# URL文件中的有效URL行（允许行首尾空白）
+_URL_LINE_RE = re.compile(r'^[ \t]*(' + _URL_RE.pattern + r')[ \t]*$', re.MULTILINE)
+# URL文件中的非空、非注释行
+_CANDIDATE_LINE_RE = re.compile(r'^[ \t]*[^\s#]', re.MULTILINE)
+
+
+class _ParquetWriter:
+    """按列收集结果行，关闭时一次写出Parquet文件（接口与csv.writer相同，需要pyarrow）"""
+    
+    def __init__(self, path: str):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise Exception("输出Parquet格式需要安装pyarrow: pip install pyarrow")
+        self.path = path
+        self.columns: Dict[str, list] = {}
+    
+    def writerow(self, row):
+        if not self.columns:
+            # 第一行为表头
+            self.columns = {name: [] for name in row}
+            return
+        for column, value in zip(self.columns.values(), row):
+            column.append(value)
+    
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+    
+    def close(self):
+        import pyarrow
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(pyarrow.Table.from_pydict(self.columns), self.path, compression='zstd')
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
 
 class AsyncBatchXPathExtractor(AsyncXPathExtractor):
     """异步批量XPath提取器"""
     
+    # 后台进度输出的间隔（秒）
+    PROGRESS_INTERVAL = 0.1
+    
+    # LLM批量请求凑批的最长等待时间（秒）
+    LLM_BATCH_WAIT = 0.05
+    
     def __init__(self, config: Dict[str, Any]):
         """
         初始化异步批量提取器
@@ -34,14 +90,16 @@ class AsyncBatchXPathExtractor(AsyncXPathExtractor):
         super().__init__(
             api_key=config.get('api_key'),
             api_base=config.get('api_base'),
-            model=config.get('model', 'Pro/deepseek-ai/DeepSeek-R1'),
+            model=config.get('model', 'deepseek-ai/DeepSeek-V3'),
             max_http_concurrent=config.get('max_http_concurrent', 20),
             max_llm_concurrent=config.get('max_llm_concurrent', 5),
             max_global_concurrent=config.get('max_global_concurrent', 50),
             request_timeout=config.get('request_timeout', 30),
             max_tokens=config.get('max_tokens', 1000),
             temperature=config.get('temperature', 0.1),
-            connection_pool_size=config.get('connection_pool_size', 100)
+            connection_pool_size=config.get('connection_pool_size', 100),
+            retry_count=config.get('retry_count', 3),
+            llm_cache_dir=config.get('llm_cache_dir')
         )
         
         self.config = config
@@ -51,7 +109,6 @@ class AsyncBatchXPathExtractor(AsyncXPathExtractor):
         self.max_concurrent = config.get('max_concurrent', 10)
         self.max_http_concurrent = config.get('max_http_concurrent', 20)
         self.max_llm_concurrent = config.get('max_llm_concurrent', 5)
-        self.batch_size = config.get('batch_size', 10)
         self.request_timeout = config.get('request_timeout', 30)
         self.llm_timeout = config.get('llm_timeout', 60)
         self.retry_count = config.get('retry_count', 3)
@@ -59,285 +116,633 @@ class AsyncBatchXPathExtractor(AsyncXPathExtractor):
         self.max_tokens = config.get('max_tokens', 1000)
         self.temperature = config.get('temperature', 0.1)
         self.connection_pool_size = config.get('connection_pool_size', 100)
-        self.batch_rest_time = config.get('batch_rest_time', 0.1)
+        # 子进程数：1表示在当前进程内处理，0表示按CPU核数
+        self.worker_processes = config.get('worker_processes', 1) or os.cpu_count() or 1
+        # 每次LLM调用合并的页面数：1表示每个URL单独调用
+        self.llm_batch_size = config.get('llm_batch_size', 1)
+        
+        # 输出格式参数
+        output_format = config.get('output_format', {})
+        self.include_content_preview = output_format.get('include_content_preview', True)
+        self.max_content_length = output_format.get('max_content_length', 200)
+        self.include_element_count = output_format.get('include_element_count', True)
+        self.include_processing_time = output_format.get('include_processing_time', True)
+        # 输出文件格式：csv（默认）或parquet
+        self.output_format = output_format.get('format', 'csv')
+        # 验证结果中只保留CSV需要的预览长度，不预览时不提取元素内容
+        self.content_preview_length = self.max_content_length if self.include_content_preview else 0
+        
+        # 结果缓存（默认关闭）：有效期内相同的(URL, 目标元素, 模型, 输出格式)直接复用上次的成功结果；
+        # 数据库读写放到单线程执行器中，避免数据库加锁时阻塞事件循环
+        self.use_cache = config.get('use_cache', False)
+        self.cache_db = config.get('cache_db', '.xpath_cache.sqlite')
+        self.cache_ttl = config.get('cache_ttl', 7 * 24 * 3600)
+        self._cache = self._open_cache() if self.use_cache else None
+        self._cache_executor = ThreadPoolExecutor(max_workers=1) if self.use_cache else None
+        
+        # CSV行构建函数（输出格式在初始化时即确定）
+        self._build_rows = self._compile_row_builder()
         
         # 更新信号量限制
         self.http_semaphore = asyncio.Semaphore(self.max_http_concurrent)
         self.llm_semaphore = asyncio.Semaphore(self.max_llm_concurrent)
-        self.global_semaphore = asyncio.Semaphore(self.max_concurrent * 2)  # 全局并发为max_concurrent的2倍
+        # 总并发由常驻worker数（max_concurrent）限定，无需全局信号量
         
         # 进度跟踪
         self.processed_count = 0
         self.total_count = 0
-        self.success_count = 0
-        self.error_count = 0
+        self._counts = [0, 0]  # [成功数, 错误数]
+        self._summary_stats = self._new_summary_stats()
         self.start_time = None
         
         # 性能监控
         self.qps_counter = 0
         self.qps_start_time = None
+        self._last_completion_ts = 0.0
+        self._ewma_interval = None
+        
+        # 整个批次共享的HTTP会话
+        self.session: Optional[aiohttp.ClientSession] = None
         
+        # 等待合并发送的LLM请求：(DOM摘要, 目标元素, future)
+        self._llm_pending: List[tuple] = []
+        self._llm_flush_handle: Optional[asyncio.TimerHandle] = None
+        self._llm_tasks: set = set()
+    
+    async def __aenter__(self):
+        await self.open_session()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def open_session(self) -> aiohttp.ClientSession:
+        """创建（或复用）整个批次共享的HTTP会话"""
+        import aiohttp
+        
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                resolver=self._dns_resolver(),
+                limit=self.connection_pool_size,
+                limit_per_host=max(10, self.max_http_concurrent),
+                ttl_dns_cache=3600,
+                keepalive_timeout=30,
+                enable_cleanup_closed=True
+            )
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+    
+    async def _session(self) -> aiohttp.ClientSession:
+        """父类方法（fetch_webpages_async等）也使用批次共享的HTTP会话"""
+        return await self.open_session()
+    
+    async def close_session(self):
+        """关闭HTTP会话（结果缓存保持打开，可继续处理下一批）"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        await super().aclose()
+    
+    async def close(self):
+        """关闭连接池和结果缓存"""
+        await self.close_session()
+        if self._cache_executor is not None:
+            self._cache_executor.shutdown(wait=True)
+            self._cache_executor = None
+            self._cache.close()
+            self._cache = None
+        
+    def _open_cache(self) -> sqlite3.Connection:
+        """打开结果缓存数据库（WAL模式，允许多个子进程同时读写）"""
+        # 连接只在缓存执行器的单个线程中使用
+        conn = sqlite3.connect(self.cache_db, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, ts INTEGER, value TEXT)")
+        return conn
+    
+    def _cache_key(self, url: str, target_elements: List[str]) -> str:
+        """缓存键：URL、排序后的目标元素、模型名、输出格式和内容预览长度的摘要"""
+        raw = "\0".join((url, json.dumps(sorted(target_elements), ensure_ascii=False), self.model,
+                         self.output_format, str(self.content_preview_length)))
+        return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def _cache_get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """读取有效期内的缓存结果（在缓存执行器中运行）"""
+        row = self._cache.execute(
+            "SELECT value FROM cache WHERE key = ? AND ts >= ?",
+            (cache_key, int(time.time() - self.cache_ttl))
+        ).fetchone()
+        return _json_loads(row[0]) if row is not None else None
+    
+    def _cache_put(self, cache_key: str, result: Dict[str, Any]):
+        """写入缓存结果（在缓存执行器中运行）"""
+        self._cache.execute(
+            "INSERT OR REPLACE INTO cache (key, ts, value) VALUES (?, ?, ?)",
+            (cache_key, int(time.time()), _json_dumps(result))
+        )
+    
     def validate_url(self, url: str) -> bool:
-        """验证URL格式"""
-        try:
-            result = urlparse(url)
-            return all([result.scheme, result.netloc])
-        except:
-            return False
+        """验证URL格式（只需确认存在协议和主机，无需完整解析）"""
+        return _URL_RE.fullmatch(url) is not None
     
     def load_urls_from_file(self, file_path: str) -> List[str]:
         """从文件加载URL列表"""
-        urls = []
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        if self.validate_url(line):
-                            urls.append(line)
-                        else:
-                            print(f"警告: 跳过无效URL: {line}")
-            return urls
+            text = Path(file_path).read_text(encoding='utf-8')
+            
+            # 整个文件只做两次C层面的正则扫描：有效URL行、以及所有非空非注释行
+            urls = _URL_LINE_RE.findall(text)
+            skipped = len(_CANDIDATE_LINE_RE.findall(text)) - len(urls)
+            if skipped:
+                print(f"警告: 跳过 {skipped} 个无效URL")
+            
+            # 保序去重，避免重复抓取
+            return list(dict.fromkeys(urls))
         except FileNotFoundError:
             raise Exception(f"URL文件未找到: {file_path}")
         except Exception as e:
             raise Exception(f"读取URL文件失败: {str(e)}")
     
+    @staticmethod
+    def _make_error_result(url: str, error: str, processing_time: float, element_count: int) -> Dict[str, Any]:
+        """构建单个URL的错误结果"""
+        return {
+            'url': url,
+            'status': 'error',
+            'error': error,
+            'processing_time': round(processing_time, 2),
+            'xpath_results': {},
+            'summary': {
+                'total_elements': element_count,
+                'successful_extractions': 0,
+                'failed_extractions': element_count
+            }
+        }
+    
+    @property
+    def success_count(self) -> int:
+        """成功处理的URL数"""
+        return self._counts[0]
+    
+    @property
+    def error_count(self) -> int:
+        """处理失败的URL数"""
+        return self._counts[1]
+    
     async def process_single_url_async(self, url: str, target_elements: List[str]) -> Dict[str, Any]:
-        """异步处理单个URL"""
-        start_time = time.time()
+        """异步处理单个URL（不抛出异常，失败时返回错误结果）"""
+        start_time = time.monotonic()
+        
+        cache_key = None
+        if self._cache is not None:
+            loop = asyncio.get_running_loop()
+            cache_key = self._cache_key(url, target_elements)
+            result = await loop.run_in_executor(self._cache_executor, self._cache_get, cache_key)
+            if result is not None:
+                self.qps_counter += 1
+                self._counts[0] += 1
+                return result
         
         try:
             # 调用父类的异步extract_xpath_async方法
-            result = await super().extract_xpath_async(url, target_elements)
+            result = await super().extract_xpath_async(url, target_elements, session=self.session)
             
             # 更新QPS计数器
             self.qps_counter += 1
-            
-            # 更新进度
-            if result['status'] == 'success':
-                self.success_count += 1
-            else:
-                self.error_count += 1
-            
-            return result
-            
         except Exception as e:
-            processing_time = time.time() - start_time
-            
-            # 更新进度
-            self.error_count += 1
-            
-            return {
-                'url': url,
-                'status': 'error',
-                'error': str(e),
-                'processing_time': round(processing_time, 2),
-                'xpath_results': {},
-                'summary': {
-                    'total_elements': len(target_elements),
-                    'successful_extractions': 0,
-                    'failed_extractions': len(target_elements)
-                }
-            }
+            result = self._make_error_result(url, str(e), time.monotonic() - start_time, len(target_elements))
+        
+        # 只缓存成功结果，失败的URL下次重新处理
+        if cache_key is not None and result['status'] == 'success':
+            await loop.run_in_executor(self._cache_executor, self._cache_put, cache_key, result)
+        
+        # 更新进度：下标0为成功，1为错误
+        self._counts[result['status'] != 'success'] += 1
+        return result
+    
+    async def extract_xpath_with_llm_async(self, tree: Any, target_elements: List[str]) -> Dict[str, str]:
+        """使用LLM提取XPath；llm_batch_size大于1时，把各worker的请求合并为批量调用"""
+        if self.llm_batch_size <= 1:
+            return await super().extract_xpath_with_llm_async(tree, target_elements)
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._llm_pending.append((self.create_dom_summary(tree), target_elements, future))
+        
+        if len(self._llm_pending) >= self.llm_batch_size:
+            self._flush_llm_batch()
+        elif self._llm_flush_handle is None:
+            # 凑不满一批时，短暂等待后发送已收集的请求
+            self._llm_flush_handle = loop.call_later(self.LLM_BATCH_WAIT, self._flush_llm_batch)
+        
+        return await future
+    
+    def _flush_llm_batch(self):
+        """把已收集的LLM请求作为一批发送"""
+        if self._llm_flush_handle is not None:
+            self._llm_flush_handle.cancel()
+            self._llm_flush_handle = None
+        
+        pending, self._llm_pending = self._llm_pending, []
+        if pending:
+            task = asyncio.ensure_future(self._send_llm_batch(pending))
+            self._llm_tasks.add(task)
+            task.add_done_callback(self._llm_tasks.discard)
+    
+    async def _send_llm_batch(self, pending: List[tuple]):
+        """发送一批LLM请求，并把结果分发给各自等待的worker"""
+        try:
+            xpath_dicts = await self.extract_xpath_batch(
+                [(dom_summary, target_elements) for dom_summary, target_elements, _ in pending],
+                batch_size=len(pending)
+            )
+        except LLMResponseError:
+            # 批量结果无法解析或与页面数量不符时，退回逐个页面的普通调用
+            await asyncio.gather(*(self._send_llm_single(*item) for item in pending))
+        except Exception as e:
+            # 限流、鉴权、超时等请求错误不再逐个重试，直接通知所有等待的worker
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(Exception(str(e)))
+        else:
+            for (_, _, future), xpath_dict in zip(pending, xpath_dicts):
+                if not future.done():
+                    future.set_result(xpath_dict)
+    
+    async def _send_llm_single(self, dom_summary: str, target_elements: List[str], future: asyncio.Future):
+        """按单个页面的提示词请求LLM，并把结果交给等待的worker"""
+        try:
+            xpath_dict = await self.extract_xpath_from_summary_async(dom_summary, target_elements)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(xpath_dict)
+    
+    def record_completion(self):
+        """记录一个URL处理完成（完成路径上只更新计数，不做终端输出）"""
+        self.processed_count += 1
+        
+        # 增量更新完成间隔的指数滑动平均，ETA无需每次重新计算总平均
+        now = time.monotonic()
+        interval = now - self._last_completion_ts
+        self._last_completion_ts = now
+        if self._ewma_interval is None:
+            self._ewma_interval = interval
+        else:
+            self._ewma_interval = 0.9 * self._ewma_interval + 0.1 * interval
+    
+    async def report_progress(self):
+        """后台定时输出进度（间隔PROGRESS_INTERVAL），终端输出不阻塞结果处理"""
+        while True:
+            await asyncio.sleep(self.PROGRESS_INTERVAL)
+            self.update_progress_display()
     
     def update_progress_display(self):
-        """更新进度显示"""
+        """输出当前进度"""
         if self.total_count == 0:
             return
-            
+        
+        now = time.monotonic()
+        finished = self.processed_count == self.total_count
         progress = (self.processed_count / self.total_count) * 100
+        elapsed = now - self.qps_start_time if self.qps_start_time else 0
         
         # 计算QPS
-        qps = 0
-        if self.qps_start_time and (time.time() - self.qps_start_time) > 0:
-            qps = self.qps_counter / (time.time() - self.qps_start_time)
+        qps = self.qps_counter / elapsed if elapsed > 0 else 0
         
         # 计算ETA
         eta = "未知"
-        if self.processed_count > 0 and self.total_count > self.processed_count:
-            avg_time_per_url = (time.time() - self.start_time) / self.processed_count
-            remaining_urls = self.total_count - self.processed_count
-            eta_seconds = avg_time_per_url * remaining_urls
+        if not finished and self._ewma_interval is not None:
+            eta_seconds = self._ewma_interval * (self.total_count - self.processed_count)
             eta = f"{int(eta_seconds // 60)}分{int(eta_seconds % 60)}秒"
         
-        print(f"\r进度: {self.processed_count}/{self.total_count} ({progress:.1f}%) "
-              f"成功: {self.success_count} 错误: {self.error_count} "
-              f"QPS: {qps:.2f} ETA: {eta}", 
-              end='', flush=True)
-    
-    def chunk_list(self, lst: List[Any], chunk_size: int) -> List[List[Any]]:
-        """将列表分块"""
-        return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
+        sys.stdout.write(f"\r进度: {self.processed_count}/{self.total_count} ({progress:.1f}%) "
+                         f"成功: {self.success_count} 错误: {self.error_count} "
+                         f"QPS: {qps:.2f} ETA: {eta}")
+        sys.stdout.flush()
     
-    async def process_batch_async(self, urls: List[str], target_elements: List[str]) -> List[Dict[str, Any]]:
-        """异步批量处理URL"""
+    async def process_batch_async(self, urls: List[str], target_elements: List[str],
+                                  keep_results: bool = False) -> List[Dict[str, Any]]:
+        """
+        异步批量处理URL（结果流式写入输出文件，摘要统计随处理累计）
+        
+        Args:
+            urls: 要处理的URL列表
+            target_elements: 要提取的元素列表
+            keep_results: 是否在内存中保留并返回全部结果；默认不保留，返回空列表
+            
+        Returns:
+            list: keep_results为True时为全部结果，否则为空列表
+        """
+        # 目标元素去重（保持顺序），避免重复的提示词内容和CSV行
+        target_elements = list(dict.fromkeys(target_elements))
+        
         self.total_count = len(urls)
         self.processed_count = 0
-        self.success_count = 0
-        self.error_count = 0
-        self.start_time = time.time()
-        self.qps_start_time = time.time()
+        self._counts = [0, 0]
+        self.start_time = time.monotonic()
+        self.qps_start_time = self.start_time
         self.qps_counter = 0
+        self._last_completion_ts = self.start_time
+        self._ewma_interval = None
+        self._summary_stats = self._new_summary_stats()
         
         print(f"开始异步批量处理 {len(urls)} 个URL")
         print(f"目标元素: {', '.join(target_elements)}")
         print(f"并发数: {self.max_concurrent}")
         print(f"HTTP并发: {self.max_http_concurrent}")
         print(f"LLM并发: {self.max_llm_concurrent}")
-        print(f"批处理大小: {self.batch_size}")
+        if self.worker_processes > 1:
+            print(f"子进程数: {self.worker_processes}")
+        if self.llm_batch_size > 1:
+            print(f"LLM批大小: {self.llm_batch_size}")
+        if self._cache is not None:
+            print(f"结果缓存: {self.cache_db}")
         print("-" * 50)
         
         results = []
+        csvfile, writer = self._open_csv_writer()
+        csv_executor = ThreadPoolExecutor(max_workers=1)
+        loop = asyncio.get_running_loop()
+        
+        async def handle_result(result: Dict[str, Any]):
+            if keep_results:
+                results.append(result)
+            self._add_to_summary(self._summary_stats, result)
+            # 结果完成即写入CSV，无需等待整个批次结束；
+            # 磁盘写入放到单线程执行器中，既不阻塞事件循环也保证写入顺序
+            await loop.run_in_executor(csv_executor, self._write_result_row,
+                                       writer, result, target_elements)
+            self.record_completion()
         
+        progress_task = asyncio.create_task(self.report_progress())
         try:
-            # 分批处理以避免内存问题
-            url_batches = self.chunk_list(urls, self.batch_size)
-            
-            for batch_idx, batch in enumerate(url_batches, 1):
-                print(f"\n处理第 {batch_idx}/{len(url_batches)} 批 (共 {len(batch)} 个URL)")
-                
-                # 创建任务列表
-                tasks = []
-                for url in batch:
-                    task = asyncio.create_task(
-                        self.process_single_url_async(url, target_elements)
-                    )
-                    tasks.append(task)
-                
-                # 等待当前批次完成
-                batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-                
-                # 处理结果
-                for result in batch_results:
-                    if isinstance(result, Exception):
-                        # 处理异常
-                        error_result = {
-                            'url': 'unknown',
-                            'status': 'error',
-                            'error': f"处理异常: {str(result)}",
-                            'processing_time': 0,
-                            'xpath_results': {},
-                            'summary': {
-                                'total_elements': len(target_elements),
-                                'successful_extractions': 0,
-                                'failed_extractions': len(target_elements)
-                            }
-                        }
-                        results.append(error_result)
-                        self.error_count += 1
-                    else:
-                        results.append(result)
-                    
-                    self.processed_count += 1
-                    self.update_progress_display()
-                
-                # 批次间短暂休息，避免过载
-                if batch_idx < len(url_batches):
-                    await asyncio.sleep(self.batch_rest_time)
+            if self.worker_processes > 1:
+                await self._run_sharded(urls, target_elements, handle_result)
+            else:
+                await self._run_workers(urls, target_elements, handle_result)
             
         except Exception as e:
             print(f"\n批量处理过程中发生错误: {str(e)}")
+        finally:
+            progress_task.cancel()
+            csv_executor.shutdown(wait=True)
+            csvfile.close()
         
+        # 最后一次总是输出
+        self.update_progress_display()
         print()  # 换行
+        print(f"结果已导出到: {self.output_file}")
         return results
     
-    def export_to_csv(self, results: List[Dict[str, Any]], target_elements: List[str]):
-        """导出结果到CSV文件"""
-        output_format = self.config.get('output_format', {})
-        include_content_preview = output_format.get('include_content_preview', True)
-        max_content_length = output_format.get('max_content_length', 200)
-        include_element_count = output_format.get('include_element_count', True)
-        include_processing_time = output_format.get('include_processing_time', True)
+    async def _run_workers(self, urls: List[str], target_elements: List[str],
+                           on_result: Callable[[Dict[str, Any]], Awaitable[None]]):
+        """在当前事件循环中用固定数量的worker处理URL，每完成一个调用一次on_result"""
+        # worker共享同一个URL迭代器：只有空闲的worker才会取下一个URL，
+        # 既保持并发上限，又不需要为每个URL创建Task或队列Future
+        url_iter = iter(urls)
+        
+        async def runner():
+            for url in url_iter:
+                result = await self.process_single_url_async(url, target_elements)
+                await on_result(result)
+        
+        # 未通过async with打开会话时，仅在本次批处理期间持有会话
+        owns_session = self.session is None
+        await self.open_session()
         
+        # 固定数量的常驻worker拉取URL
+        runners = [asyncio.ensure_future(runner()) for _ in range(self.max_concurrent)]
         try:
-            with open(self.output_file, 'w', newline='', encoding='utf-8-sig') as csvfile:
-                # 构建表头
-                headers = ['URL', '元素名称', 'XPath', '状态']
+            await asyncio.gather(*runners)
+        finally:
+            # 某个worker出错时取消其余worker，避免其继续写入即将关闭的执行器
+            for task in runners:
+                task.cancel()
+            await asyncio.gather(*runners, return_exceptions=True)
+            if owns_session:
+                await self.close_session()
+    
+    async def _run_sharded(self, urls: List[str], target_elements: List[str],
+                           on_result: Callable[[Dict[str, Any]], Awaitable[None]]):
+        """
+        将URL分片到多个子进程处理，每个子进程运行独立的事件循环，
+        避免HTML解析等CPU密集操作占满单个事件循环
+        """
+        if not urls:
+            return
+        
+        loop = asyncio.get_running_loop()
+        shard_config = self._shard_config()
+        
+        # 分片数多于进程数，使结果能更平滑地流回主进程
+        shard_count = min(len(urls), self.worker_processes * 4) or 1
+        shard_size = -(-len(urls) // shard_count)
+        shards = [
+            (shard_config, urls[i:i + shard_size], target_elements)
+            for i in range(0, len(urls), shard_size)
+        ]
+        
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(processes=self.worker_processes) as pool:
+            shard_iter = pool.imap_unordered(_process_shard, shards)
+            while True:
+                # 阻塞的next()放到线程中执行，避免卡住事件循环
+                shard_results = await loop.run_in_executor(None, next, shard_iter, None)
+                if shard_results is None:
+                    break
+                
+                for result in shard_results:
+                    self.qps_counter += 1
+                    self._counts[result['status'] != 'success'] += 1
+                    await on_result(result)
+    
+    def _shard_config(self) -> Dict[str, Any]:
+        """生成子进程配置：并发上限按进程数均分，保持总体并发不变；
+        不含完整URL列表，每个子进程只接收自己分片的URL"""
+        def share(value: int) -> int:
+            return max(1, -(-value // self.worker_processes))
+        
+        shard_config = {key: value for key, value in self.config.items() if key != 'urls'}
+        shard_config.update({
+            'worker_processes': 1,
+            'max_concurrent': share(self.max_concurrent),
+            'max_http_concurrent': share(self.max_http_concurrent),
+            'max_llm_concurrent': share(self.max_llm_concurrent),
+            'connection_pool_size': share(self.connection_pool_size)
+        })
+        return shard_config
+    
+    async def _collect_shard_async(self, urls: List[str], target_elements: List[str]) -> List[Dict[str, Any]]:
+        """子进程内处理一个分片并返回全部结果"""
+        results = []
+        
+        async def collect(result: Dict[str, Any]):
+            results.append(result)
+        
+        await self._run_workers(urls, target_elements, collect)
+        return results
+    
+    def _open_csv_writer(self):
+        """
+        打开输出文件并写入表头（format为parquet时改为按列收集，关闭时写出）
+        
+        Returns:
+            tuple: (文件对象, csv.writer)
+        """
+        # 构建表头
+        headers = ['URL', '元素名称', 'XPath', '状态']
+        if self.include_content_preview:
+            headers.append('内容预览')
+        if self.include_element_count:
+            headers.append('匹配数量')
+        if self.include_processing_time:
+            headers.append('处理时间(秒)')
+        headers.append('错误信息')
+        
+        if self.output_format == 'parquet':
+            writer = _ParquetWriter(self.output_file)
+            writer.writerow(headers)
+            return writer, writer
+        
+        try:
+            csvfile = open(self.output_file, 'w', newline='', encoding='utf-8-sig')
+            writer = csv.writer(csvfile)
+            writer.writerow(headers)
+            return csvfile, writer
+        except Exception as e:
+            raise Exception(f"导出CSV失败: {str(e)}")
+    
+    def _compile_row_builder(self):
+        """
+        根据输出格式配置生成行构建函数，配置判断只做一次
+        
+        Returns:
+            callable: (result, target_elements) -> 该URL的CSV行迭代器
+        """
+        include_content_preview = self.include_content_preview
+        max_content_length = self.max_content_length
+        include_element_count = self.include_element_count
+        include_processing_time = self.include_processing_time
+        
+        # 行按表头顺序构建为序列，省去DictWriter逐字段的字典查找
+        def build_rows(result: Dict[str, Any], target_elements: List[str]):
+            url = result['url']
+            processing_time = result.get('processing_time', 0)
+            
+            if result['status'] != 'success':
+                # 错误行：每个目标元素一行
+                tail = []
                 if include_content_preview:
-                    headers.append('内容预览')
+                    tail.append('')
                 if include_element_count:
-                    headers.append('匹配数量')
+                    tail.append(0)
                 if include_processing_time:
-                    headers.append('处理时间(秒)')
-                headers.append('错误信息')
+                    tail.append(processing_time)
+                tail.append(result.get('error', '未知错误'))
+                tail = tuple(tail)
                 
-                writer = csv.DictWriter(csvfile, fieldnames=headers)
-                writer.writeheader()
+                for element_name in target_elements:
+                    yield (url, element_name, '', '错误') + tail
+                return
+            
+            # 为每个元素生成一行
+            for element_name, element_result in result['xpath_results'].items():
+                row = [
+                    url,
+                    element_name,
+                    element_result.get('xpath', ''),
+                    '成功' if element_result.get('found', False) else '失败'
+                ]
+                
+                if include_content_preview:
+                    content = element_result.get('content') or ''
+                    row.append(content[:max_content_length] + '...' if len(content) > max_content_length else content)
                 
-                # 写入数据
-                for result in results:
-                    url = result['url']
-                    processing_time = result.get('processing_time', 0)
-                    
-                    if result['status'] == 'success':
-                        # 为每个元素写入一行
-                        for element_name, element_result in result['xpath_results'].items():
-                            row = {
-                                'URL': url,
-                                '元素名称': element_name,
-                                'XPath': element_result.get('xpath', ''),
-                                '状态': '成功' if element_result.get('found', False) else '失败',
-                                '错误信息': ''
-                            }
-                            
-                            if include_content_preview and element_result.get('content'):
-                                content = element_result['content']
-                                row['内容预览'] = content[:max_content_length] + '...' if len(content) > max_content_length else content
-                            else:
-                                row['内容预览'] = ''
-                            
-                            if include_element_count:
-                                row['匹配数量'] = element_result.get('element_count', 0)
-                            
-                            if include_processing_time:
-                                row['处理时间(秒)'] = processing_time
-                            
-                            writer.writerow(row)
-                    else:
-                        # 写入错误行
-                        for element_name in target_elements:
-                            row = {
-                                'URL': url,
-                                '元素名称': element_name,
-                                'XPath': '',
-                                '状态': '错误',
-                                '内容预览': '',
-                                '匹配数量': 0,
-                                '处理时间(秒)': processing_time,
-                                '错误信息': result.get('error', '未知错误')
-                            }
-                            writer.writerow(row)
+                if include_element_count:
+                    row.append(element_result.get('element_count', 0))
+                
+                if include_processing_time:
+                    row.append(processing_time)
+                
+                row.append('')
+                yield row
+        
+        return build_rows
+    
+    def _write_result_row(self, writer: Any, result: Dict[str, Any], target_elements: List[str]):
+        """将单个URL的处理结果写入CSV（每个元素一行）"""
+        writer.writerows(self._build_rows(result, target_elements))
+    
+    def export_to_csv(self, results: List[Dict[str, Any]], target_elements: List[str]):
+        """导出结果到CSV文件"""
+        csvfile, writer = self._open_csv_writer()
+        build_rows = self._build_rows
+        
+        try:
+            with csvfile:
+                writer.writerows(row for result in results for row in build_rows(result, target_elements))
             
             print(f"结果已导出到: {self.output_file}")
             
         except Exception as e:
             raise Exception(f"导出CSV失败: {str(e)}")
     
-    def print_summary(self, results: List[Dict[str, Any]]):
-        """打印处理摘要"""
-        total_urls = len(results)
-        successful_urls = sum(1 for r in results if r['status'] == 'success')
-        error_urls = sum(1 for r in results if r['status'] == 'error')
+    @staticmethod
+    def _new_summary_stats() -> Dict[str, Any]:
+        """空的摘要统计"""
+        return dict.fromkeys(('total_urls', 'successful_urls', 'error_urls', 'total_elements',
+                              'successful_extractions', 'failed_extractions', 'total_processing_time'), 0)
+    
+    @staticmethod
+    def _add_to_summary(stats: Dict[str, Any], result: Dict[str, Any]):
+        """把一个URL的结果累计到摘要统计中"""
+        stats['total_urls'] += 1
+        status = result['status']
+        if status == 'success':
+            stats['successful_urls'] += 1
+        elif status == 'error':
+            stats['error_urls'] += 1
+        
+        summary = result['summary']
+        stats['total_elements'] += summary['total_elements']
+        stats['successful_extractions'] += summary['successful_extractions']
+        stats['failed_extractions'] += summary['failed_extractions']
+        stats['total_processing_time'] += result.get('processing_time', 0)
+    
+    def print_summary(self, results: Optional[List[Dict[str, Any]]] = None):
+        """打印处理摘要（未传入results时使用最近一次process_batch_async累计的统计）"""
+        if results is None:
+            stats = self._summary_stats
+        else:
+            stats = self._new_summary_stats()
+            for r in results:
+                self._add_to_summary(stats, r)
         
-        total_elements = sum(r['summary']['total_elements'] for r in results)
-        successful_extractions = sum(r['summary']['successful_extractions'] for r in results)
-        failed_extractions = sum(r['summary']['failed_extractions'] for r in results)
+        total_urls = stats['total_urls']
+        successful_urls = stats['successful_urls']
+        error_urls = stats['error_urls']
+        total_elements = stats['total_elements']
+        successful_extractions = stats['successful_extractions']
+        failed_extractions = stats['failed_extractions']
+        total_processing_time = stats['total_processing_time']
         
-        avg_processing_time = sum(r.get('processing_time', 0) for r in results) / total_urls if total_urls > 0 else 0
+        avg_processing_time = total_processing_time / total_urls if total_urls > 0 else 0
         
         # 计算总体QPS
-        total_time = time.time() - self.start_time if self.start_time else 0
+        total_time = time.monotonic() - self.start_time if self.start_time else 0
         overall_qps = total_urls / total_time if total_time > 0 else 0
         
         print("\n" + "=" * 60)
         print("异步批量处理摘要")
         print("=" * 60)
         print(f"总URL数: {total_urls}")
-        print(f"成功处理: {successful_urls} ({successful_urls/total_urls*100:.1f}%)")
-        print(f"处理失败: {error_urls} ({error_urls/total_urls*100:.1f}%)")
+        print(f"成功处理: {successful_urls} ({successful_urls/max(total_urls, 1)*100:.1f}%)")
+        print(f"处理失败: {error_urls} ({error_urls/max(total_urls, 1)*100:.1f}%)")
         print(f"总元素数: {total_elements}")
-        print(f"成功提取: {successful_extractions} ({successful_extractions/total_elements*100:.1f}%)")
+        print(f"成功提取: {successful_extractions} ({successful_extractions/max(total_elements, 1)*100:.1f}%)")
         print(f"提取失败: {failed_extractions}")
         print(f"平均处理时间: {avg_processing_time:.2f}秒")
         print(f"总体QPS: {overall_qps:.2f}")
@@ -349,7 +754,7 @@ class AsyncBatchXPathExtractor(AsyncXPathExtractor):
         if not self.start_time:
             return
             
-        total_time = time.time() - self.start_time
+        total_time = time.monotonic() - self.start_time
         overall_qps = self.total_count / total_time if total_time > 0 else 0
         
         print("\n" + "=" * 60)
@@ -359,4 +764,11 @@ class AsyncBatchXPathExtractor(AsyncXPathExtractor):
         print(f"总体QPS: {overall_qps:.2f}")
         print(f"平均每URL处理时间: {total_time/self.total_count:.2f}秒" if self.total_count > 0 else "平均每URL处理时间: N/A")
         print(f"并发效率: {overall_qps/self.max_concurrent:.2%}" if self.max_concurrent > 0 else "并发效率: N/A")
-        print("=" * 60)
\ No newline at end of file
+        print("=" * 60)
+
+
+def _process_shard(args) -> List[Dict[str, Any]]:
+    """子进程入口：在独立事件循环中处理一个URL分片"""
+    config, urls, target_elements = args
+    extractor = AsyncBatchXPathExtractor(config)
+    return asyncio.run(extractor._collect_shard_async(urls, target_elements))
@@ -7,11 +7,13 @@ import asyncio
 import sys
 import os
 import argparse
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from typing import Dict, Any
 
-# 导入配置管理器和异步批量提取器
+# 导入配置管理器（异步批量提取器在实际运行时才导入，加快--init-config等命令的启动）
 from config_manager import ConfigManager
-from async_batch_extractor import AsyncBatchXPathExtractor
 
 
 def create_argument_parser():
@@ -35,6 +37,9 @@ def create_argument_parser():
   
   # 显示性能统计
   python async_main.py --config async_config.json --show-stats
+  
+  # 忽略结果缓存，重新处理所有URL
+  python async_main.py --config async_config.json --no-cache
         """
     )
     
@@ -68,6 +73,12 @@ def create_argument_parser():
         help='显示性能统计'
     )
     
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='不使用结果缓存，重新处理所有URL'
+    )
+    
     parser.add_argument(
         '--quiet', '-q',
         action='store_true',
@@ -77,7 +88,34 @@ def create_argument_parser():
     return parser
 
 
-async def run_async_batch_processing(config_path: str, verbose: bool = False, quiet: bool = False, show_stats: bool = False):
+def setup_logging(verbose: bool = False, quiet: bool = False) -> QueueListener:
+    """
+    配置日志：事件循环中只把日志记录放入队列，由后台线程负责写出，
+    避免终端输出阻塞事件循环
+    
+    Returns:
+        QueueListener: 已启动的日志监听器，结束时需调用stop()
+    """
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    if verbose:
+        root.setLevel(logging.INFO)
+    elif quiet:
+        root.setLevel(logging.ERROR)
+    else:
+        root.setLevel(logging.WARNING)
+    
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+
+async def run_async_batch_processing(config_path: str, verbose: bool = False, quiet: bool = False, show_stats: bool = False,
+                                     no_cache: bool = False):
     """运行异步批量处理"""
     
     if quiet:
@@ -89,6 +127,8 @@ async def run_async_batch_processing(config_path: str, verbose: bool = False, qu
         # 加载配置
         config_manager = ConfigManager()
         config = config_manager.load_config(config_path)
+        if no_cache:
+            config["use_cache"] = False
         
         if not quiet:
             print("配置加载成功")
@@ -105,6 +145,7 @@ async def run_async_batch_processing(config_path: str, verbose: bool = False, qu
             return False
         
         # 初始化异步批量提取器
+        from async_batch_extractor import AsyncBatchXPathExtractor
         extractor = AsyncBatchXPathExtractor(config)
         
         # 获取处理参数
@@ -115,15 +156,12 @@ async def run_async_batch_processing(config_path: str, verbose: bool = False, qu
             print(f"开始处理 {len(urls)} 个URL")
             print(f"目标元素: {', '.join(target_elements)}")
         
-        # 执行异步批量处理
-        results = await extractor.process_batch_async(urls, target_elements)
-        
-        # 导出结果
-        extractor.export_to_csv(results, target_elements)
+        # 执行异步批量处理（结果在处理过程中流式写入CSV）
+        await extractor.process_batch_async(urls, target_elements)
         
-        # 打印摘要
+        # 打印摘要（使用处理过程中累计的统计，不在内存中保留全部结果）
         if not quiet:
-            extractor.print_summary(results)
+            extractor.print_summary()
             
             # 显示性能统计
             if show_stats:
@@ -166,13 +204,31 @@ def main():
             sys.exit(1)
         
     elif args.config:
-        # 运行异步批量处理
-        success = asyncio.run(run_async_batch_processing(
-            args.config,
-            verbose=args.verbose,
-            quiet=args.quiet,
-            show_stats=args.show_stats
-        ))
+        # 可选：使用uvloop作为事件循环以提升大量并发连接时的性能
+        # （uvloop.install()已弃用：新版本用uvloop.run()，旧版本设置事件循环策略）
+        run = asyncio.run
+        try:
+            import uvloop
+        except ImportError:
+            pass
+        else:
+            if hasattr(uvloop, 'run'):
+                run = uvloop.run
+            else:
+                asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        
+        # 运行异步批量处理（--verbose时输出每个URL的处理步骤）
+        listener = setup_logging(verbose=args.verbose, quiet=args.quiet)
+        try:
+            success = run(run_async_batch_processing(
+                args.config,
+                verbose=args.verbose,
+                quiet=args.quiet,
+                show_stats=args.show_stats,
+                no_cache=args.no_cache
+            ))
+        finally:
+            listener.stop()
         
         if not success:
             sys.exit(1)
@@ -3,29 +3,97 @@
 异步批量网页清洗工具 - 使用异步IO提高效率
 """
 
-import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
+import json
 import os
 import sys
 import time
 from urllib.parse import urlparse
 import re
-import aiofiles
-from typing import List, Dict, Tuple
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from typing import List, Dict, Tuple, Optional
+
+
+# 清洗时保留的属性（data-*属性另行保留）
+_KEEP_ATTRS = frozenset(('id', 'class', 'href', 'src', 'alt', 'title', 'name', 'type', 'value'))
+
+# 文件名中连续的特殊字符/下划线
+_FNAME_BAD_RUN = re.compile(r'(?:[^\w\-.]|_)+')
+
+
+def _parse_and_clean(body: bytes, charset: Optional[str]) -> bytes:
+    """
+    解析并清洗网页（在子进程中执行，因此为模块级函数）
+    
+    Args:
+        body: 原始网页字节
+        charset: 响应头声明的编码（为空时由lxml自动检测）
+        
+    Returns:
+        bytes: 清洗后的UTF-8编码HTML
+    """
+    # 解析进程只需要lxml，在这里导入，子进程启动时无需加载aiohttp等模块
+    import lxml.html
+    from lxml import etree
+    
+    # 解析时即丢弃注释和处理指令
+    parser = lxml.html.HTMLParser(encoding=charset, remove_comments=True, remove_pis=True)
+    tree = lxml.html.document_fromstring(body, parser=parser)
+    
+    # 移除script和style标签
+    etree.strip_elements(tree, 'script', 'style', with_tail=False)
+    
+    # 移除不需要的属性：保留重要属性和data-*属性
+    for el in tree.iter(etree.Element):
+        attrib = el.attrib
+        if not attrib:
+            continue
+        for attr in [k for k in attrib if k not in _KEEP_ATTRS and k[:5] != 'data-']:
+            del attrib[attr]
+    
+    # 直接序列化为UTF-8字节，不做格式化缩进
+    return lxml.html.tostring(tree, encoding='utf-8')
+
+
+def _dns_resolver():
+    """安装了aiodns时使用非阻塞的c-ares DNS解析；否则返回None，使用aiohttp默认的线程池解析"""
+    import aiohttp
+    
+    try:
+        return aiohttp.AsyncResolver()
+    except RuntimeError:
+        # 未安装aiodns
+        return None
 
 
 class AsyncBatchWebCleaner:
-    def __init__(self, max_concurrent=20, timeout=30):
+    def __init__(self, max_concurrent=20, timeout=30, rate_per_host=5.0, burst_per_host=10,
+                 parse_processes=None, aggregate_file=None):
         """
         初始化异步批量网页清洗器
         
         Args:
             max_concurrent: 最大并发数
             timeout: 请求超时时间
+            rate_per_host: 每个主机每秒最多发起的请求数（0表示不限速）
+            burst_per_host: 每个主机允许的突发请求数
+            parse_processes: 解析网页的进程数（默认按CPU核数，0表示在线程中解析）
+            aggregate_file: 汇总文件路径；设置后所有页面写入同一个文件，而不是每个URL一个文件
         """
         self.max_concurrent = max_concurrent
         self.timeout = timeout
+        self.rate_per_host = rate_per_host
+        self.burst_per_host = burst_per_host
+        # 每个主机的令牌桶：host -> (剩余令牌数, 上次更新时间)
+        self._host_buckets: Dict[str, Tuple[float, float]] = {}
+        self.parse_processes = (os.cpu_count() or 1) if parse_processes is None else parse_processes
+        # 解析网页用的进程池（仅在process_urls期间存在）
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+        self.aggregate_file = aggregate_file
+        # 汇总模式下待写入的页面：(url, 清洗后的HTML)，仅在process_urls期间存在
+        self._aggregate_queue: Optional[asyncio.Queue] = None
         self.processed_count = 0
         self.success_count = 0
         self.error_count = 0
@@ -46,11 +114,8 @@ class AsyncBatchWebCleaner:
             # 移除协议
             filename = parsed.netloc + parsed.path
             
-            # 替换特殊字符为下划线
-            filename = re.sub(r'[^\w\-_\.]', '_', filename)
-            
-            # 移除连续的下划线
-            filename = re.sub(r'_+', '_', filename)
+            # 替换特殊字符为下划线，并合并连续的下划线（一次扫描完成）
+            filename = _FNAME_BAD_RUN.sub('_', filename)
             
             # 移除开头和结尾的下划线
             filename = filename.strip('_')
@@ -95,58 +160,80 @@ class AsyncBatchWebCleaner:
             pass
         
         try:
-            # 预热域名
-            try:
-                parsed = urlparse(url)
-                if parsed.hostname:
-                    warmup_url = f"{parsed.scheme}://{parsed.hostname}"
-                    async with session.get(warmup_url, headers=headers, timeout=8) as response:
-                        await response.read()
-            except Exception:
-                pass
-
             async with session.get(url, headers=headers, timeout=self.timeout) as response:
                 response.raise_for_status()
-                html_content = await response.text()
-                
-                # 使用BeautifulSoup清理和格式化HTML
-                soup = BeautifulSoup(html_content, 'html.parser')
-                
-                # 移除script和style标签
-                for script in soup(["script", "style"]):
-                    script.decompose()
-                
-                # 移除注释
-                for comment in soup.find_all(string=lambda text: isinstance(text, type(soup.comment))):
-                    comment.extract()
-                
-                # 移除不需要的属性
-                for tag in soup.find_all(True):
-                    # 保留重要属性，移除其他属性
-                    important_attrs = ['id', 'class', 'href', 'src', 'alt', 'title', 'name', 'type', 'value']
-                    attrs_to_remove = []
-                    for attr in tag.attrs:
-                        if attr not in important_attrs and not attr.startswith('data-'):
-                            attrs_to_remove.append(attr)
-                    
-                    for attr in attrs_to_remove:
-                        del tag.attrs[attr]
-                
-                # 获取清理后的HTML
-                cleaned_html = soup.prettify()
-                
-                # 生成文件名
-                filename = self.sanitize_filename(url) + '.html'
-                
-                # 异步保存到文件
-                async with aiofiles.open(filename, 'w', encoding='utf-8') as f:
-                    await f.write(cleaned_html)
-                
-                return True, filename, None
-                
+                body = await response.read()
+                charset = response.charset
+            
+            # 解析和清洗是CPU密集操作，交给进程池执行，不占用事件循环（未启用进程池时使用默认线程池）
+            loop = asyncio.get_running_loop()
+            cleaned_html = await loop.run_in_executor(self._parse_pool, _parse_and_clean, body, charset)
+            
+            if self._aggregate_queue is not None:
+                # 汇总模式：交给唯一的写入协程追加到汇总文件
+                self._aggregate_queue.put_nowait((url, cleaned_html))
+                return True, self.aggregate_file, None
+            
+            # 生成文件名
+            filename = self.sanitize_filename(url) + '.html'
+            
+            # 在线程中一次性写入文件，不阻塞事件循环
+            await asyncio.to_thread(Path(filename).write_bytes, cleaned_html)
+            
+            return True, filename, None
+            
         except Exception as e:
             return False, None, str(e)
     
+    async def write_aggregate(self, fp, queue):
+        """
+        汇总文件的唯一写入协程：每次取出队列中已有的全部页面，合并为一次写入
+        
+        每个页面写为一行JSON索引 {"url": ..., "len": 字节数}，紧跟len字节的HTML和一个换行
+        
+        Args:
+            fp: 以二进制模式打开的汇总文件
+            queue: 页面队列，收到None时结束
+        """
+        done = False
+        while not done:
+            items = [await queue.get()]
+            while not queue.empty():
+                items.append(queue.get_nowait())
+            
+            parts = []
+            for item in items:
+                if item is None:
+                    done = True
+                    continue
+                url, page = item
+                header = json.dumps({"url": url, "len": len(page)}, ensure_ascii=False).encode('utf-8')
+                parts += (header, b"\n", page, b"\n")
+            
+            if parts:
+                await asyncio.to_thread(fp.write, b''.join(parts))
+    
+    async def wait_for_host_slot(self, url):
+        """
+        按主机令牌桶限速：令牌不足时等待，避免单个主机被突发请求触发429
+        
+        Args:
+            url: 即将请求的URL
+        """
+        if not self.rate_per_host:
+            return
+        
+        host = urlparse(url).hostname or ''
+        now = time.monotonic()
+        tokens, last = self._host_buckets.get(host, (self.burst_per_host, now))
+        
+        # 补充令牌后预占一个；为负数时表示需要排队等待的时长
+        tokens = min(self.burst_per_host, tokens + (now - last) * self.rate_per_host) - 1
+        self._host_buckets[host] = (tokens, now)
+        
+        if tokens < 0:
+            await asyncio.sleep(-tokens / self.rate_per_host)
+    
     async def process_single_url(self, session, url):
         """
         异步处理单个URL
@@ -158,6 +245,7 @@ class AsyncBatchWebCleaner:
         Returns:
             dict: 处理结果
         """
+        await self.wait_for_host_slot(url)
         success, filename, error = await self.fetch_and_clean_webpage(session, url)
         
         self.processed_count += 1
@@ -166,16 +254,9 @@ class AsyncBatchWebCleaner:
         else:
             self.error_count += 1
         
-        # 显示进度
-        progress = f"[{self.processed_count}/{self.total_count}] "
-        elapsed_time = time.time() - self.start_time
-        avg_time = elapsed_time / self.processed_count if self.processed_count > 0 else 0
-        eta = avg_time * (self.total_count - self.processed_count) if avg_time > 0 else 0
-        
-        if success:
-            print(f"{progress}✓ 成功: {url} -> {filename} (ETA: {eta:.1f}s)")
-        else:
-            print(f"{progress}✗ 失败: {url} - {error} (ETA: {eta:.1f}s)")
+        # 整体进度由心跳任务定时输出，这里只输出失败信息
+        if not success:
+            print(f"✗ 失败: {url} - {error}")
         
         return {
             'url': url,
@@ -184,6 +265,25 @@ class AsyncBatchWebCleaner:
             'error': error
         }
     
+    async def report_progress(self, interval=1.0):
+        """
+        定时输出处理进度（代替每个URL输出一次）
+        
+        Args:
+            interval: 输出间隔（秒）
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        while True:
+            await asyncio.sleep(interval)
+            self.print_progress(loop.time() - start)
+    
+    def print_progress(self, elapsed_time):
+        """输出一行进度信息"""
+        done = self.processed_count
+        eta = elapsed_time / done * (self.total_count - done) if done else 0
+        print(f"[{done}/{self.total_count}] 成功: {self.success_count} 失败: {self.error_count} (ETA: {eta:.1f}s)")
+    
     def load_urls_from_file(self, file_path):
         """
         从文件加载URL列表
@@ -221,24 +321,43 @@ class AsyncBatchWebCleaner:
         self.success_count = 0
         self.error_count = 0
         self.start_time = time.time()
+        self._host_buckets.clear()
         
         print(f"开始处理 {self.total_count} 个URL...")
         print(f"并发数: {self.max_concurrent}")
         print(f"超时时间: {self.timeout}秒")
+        if self.rate_per_host:
+            print(f"单主机限速: {self.rate_per_host}次/秒")
+        if self.aggregate_file:
+            print(f"汇总文件: {self.aggregate_file}")
         print("-" * 60)
         
-        # 创建信号量控制并发数
-        semaphore = asyncio.Semaphore(self.max_concurrent)
+        # 按输入顺序存放结果
+        processed_results = [None] * self.total_count
+        url_iter = iter(enumerate(urls))
         
-        async def process_with_semaphore(url):
-            async with semaphore:
-                return await self.process_single_url(session, url)
+        async def worker():
+            # 固定数量的worker共享同一个URL迭代器，内存占用与URL总数无关
+            for i, url in url_iter:
+                try:
+                    processed_results[i] = await self.process_single_url(session, url)
+                except Exception as e:
+                    processed_results[i] = {
+                        'url': url,
+                        'success': False,
+                        'filename': None,
+                        'error': str(e)
+                    }
+                    self.error_count += 1
+        
+        import aiohttp
         
         # 创建连接池
         connector = aiohttp.TCPConnector(
+            resolver=_dns_resolver(),
             limit=self.max_concurrent,
             limit_per_host=5,  # 限制每个主机的并发连接数
-            ttl_dns_cache=300,
+            ttl_dns_cache=3600,  # 抓取期间主机IP基本不变
             use_dns_cache=True
         )
         
@@ -249,27 +368,38 @@ class AsyncBatchWebCleaner:
             timeout=timeout,
             headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
         ) as session:
-            # 创建所有任务
-            tasks = [process_with_semaphore(url) for url in urls]
-            
-            # 等待所有任务完成
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # 处理异常结果
-            processed_results = []
-            for i, result in enumerate(results):
-                if isinstance(result, Exception):
-                    processed_results.append({
-                        'url': urls[i],
-                        'success': False,
-                        'filename': None,
-                        'error': str(result)
-                    })
-                    self.error_count += 1
-                else:
-                    processed_results.append(result)
+            if self.parse_processes:
+                # 子进程使用spawn启动，避免fork带有事件循环和线程的父进程
+                self._parse_pool = ProcessPoolExecutor(
+                    max_workers=self.parse_processes,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            aggregate_fp = None
+            writer_task = None
+            if self.aggregate_file:
+                aggregate_fp = open(self.aggregate_file, 'wb')
+                self._aggregate_queue = asyncio.Queue()
+                writer_task = asyncio.create_task(self.write_aggregate(aggregate_fp, self._aggregate_queue))
+            progress_task = asyncio.create_task(self.report_progress())
+            try:
+                # 启动max_concurrent个常驻worker，等待全部URL处理完成
+                await asyncio.gather(*(worker() for _ in range(self.max_concurrent)))
+                if writer_task is not None:
+                    # 通知写入协程结束，并等待剩余页面写完
+                    self._aggregate_queue.put_nowait(None)
+                    await writer_task
+            finally:
+                progress_task.cancel()
+                if writer_task is not None:
+                    writer_task.cancel()
+                    aggregate_fp.close()
+                    self._aggregate_queue = None
+                if self._parse_pool is not None:
+                    self._parse_pool.shutdown()
+                    self._parse_pool = None
         
         total_time = time.time() - self.start_time
+        self.print_progress(total_time)
         print("-" * 60)
         print(f"处理完成！")
         print(f"总数: {self.total_count}")
@@ -288,26 +418,32 @@ class AsyncBatchWebCleaner:
             results: 处理结果列表
             output_file: 输出文件名
         """
-        async with aiofiles.open(output_file, 'w', encoding='utf-8') as f:
-            await f.write("异步批量网页清洗结果摘要\n")
-            await f.write("=" * 50 + "\n\n")
-            
-            await f.write(f"处理时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-            await f.write(f"总数: {len(results)}\n")
-            await f.write(f"成功: {len([r for r in results if r['success']])}\n")
-            await f.write(f"失败: {len([r for r in results if not r['success']])}\n\n")
-            
-            await f.write("成功列表:\n")
-            await f.write("-" * 30 + "\n")
-            for result in results:
-                if result['success']:
-                    await f.write(f"✓ {result['url']} -> {result['filename']}\n")
-            
-            await f.write("\n失败列表:\n")
-            await f.write("-" * 30 + "\n")
-            for result in results:
-                if not result['success']:
-                    await f.write(f"✗ {result['url']} - {result['error']}\n")
+        # 一次遍历同时生成成功和失败列表
+        success_lines = []
+        failure_lines = []
+        for result in results:
+            if result['success']:
+                success_lines.append(f"✓ {result['url']} -> {result['filename']}\n")
+            else:
+                failure_lines.append(f"✗ {result['url']} - {result['error']}\n")
+        
+        lines = [
+            "异步批量网页清洗结果摘要\n",
+            "=" * 50 + "\n\n",
+            f"处理时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n",
+            f"总数: {len(results)}\n",
+            f"成功: {len(success_lines)}\n",
+            f"失败: {len(failure_lines)}\n\n",
+            "成功列表:\n",
+            "-" * 30 + "\n",
+            *success_lines,
+            "\n失败列表:\n",
+            "-" * 30 + "\n",
+            *failure_lines
+        ]
+        
+        # 拼接完整内容后在线程中一次性写入
+        await asyncio.to_thread(Path(output_file).write_text, ''.join(lines), encoding='utf-8')
         
         print(f"结果摘要已保存到: {output_file}")
 
@@ -316,33 +452,49 @@ async def main():
     """异步主函数"""
     if len(sys.argv) < 2:
         print("使用方法:")
-        print("  python async_web_cleaner.py <url1> [url2] [url3] ...")
-        print("  python async_web_cleaner.py -f <urls_file>")
+        print("  python async_web_cleaner.py [--aggregate] <url1> [url2] [url3] ...")
+        print("  python async_web_cleaner.py [--aggregate] -f <urls_file>")
+        print("")
+        print("  --aggregate  所有页面写入同一个 cleaned_pages.jsonl，而不是每个URL一个文件")
         print("")
         print("示例:")
         print("  python async_web_cleaner.py https://example.com https://google.com")
         print("  python async_web_cleaner.py -f urls.txt")
+        print("  python async_web_cleaner.py --aggregate -f urls.txt")
         sys.exit(1)
     
+    args = sys.argv[1:]
+    aggregate = '--aggregate' in args
+    if aggregate:
+        args.remove('--aggregate')
+    
     # 初始化异步清洗器
-    cleaner = AsyncBatchWebCleaner(max_concurrent=20, timeout=30)
+    cleaner = AsyncBatchWebCleaner(
+        max_concurrent=20,
+        timeout=30,
+        aggregate_file='cleaned_pages.jsonl' if aggregate else None
+    )
     
     urls = []
     
-    if sys.argv[1] == '-f':
+    if args and args[0] == '-f':
         # 从文件读取URL
-        if len(sys.argv) < 3:
+        if len(args) < 2:
             print("错误: 请指定URL文件路径")
             sys.exit(1)
         
-        file_path = sys.argv[2]
+        file_path = args[1]
         urls = cleaner.load_urls_from_file(file_path)
         if not urls:
             print("错误: 无法从文件中读取URL")
             sys.exit(1)
     else:
         # 从命令行参数读取URL
-        urls = sys.argv[1:]
+        urls = args
+    
+    if not urls:
+        print("错误: 请指定要处理的URL")
+        sys.exit(1)
     
     # 处理URL
     results = await cleaner.process_urls(urls)
@@ -3,37 +3,181 @@
 异步XPath提取工具 - 使用LLM智能提取网页元素的XPath
 """
 
+from __future__ import annotations
+
 import asyncio
-import aiohttp
-from bs4 import BeautifulSoup
-from openai import AsyncOpenAI
+import functools
+import hashlib
 import json
 import sys
 import os
 from urllib.parse import urljoin, urlparse
 import re
 import time
-from typing import Dict, List, Any, Optional, Tuple
+import logging
+from typing import TYPE_CHECKING, Dict, List, Any, Optional, Tuple
+
+# aiohttp、lxml、openai导入开销较大，在实际用到的方法中再导入，加快命令行启动
+if TYPE_CHECKING:
+    import aiohttp
+    from lxml import html
+
+
+# 可选：使用orjson加速LLM返回结果的解析（orjson.JSONDecodeError是json.JSONDecodeError的子类）
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+    
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+logger = logging.getLogger(__name__)
+
+# DOM摘要中收录的主要内容标签及数量上限
+_SUMMARY_TAGS = ('h1', 'h2', 'h3', 'article', 'main', 'div')
+_SUMMARY_LIMIT = 50
+# DOM摘要中保留的属性（另外保留全部data-*属性）
+_SUMMARY_ATTRS = frozenset(('id', 'class'))
+
+# 连续空白
+_WS_RE = re.compile(r'\s+')
+
+# 模型不支持工具调用或JSON输出格式时的错误信息（其他BadRequestError不改用下一种输出方式）
+_UNSUPPORTED_MODE_RE = re.compile(
+    r'response_format|tool_choice|json_object|function[ _]call|tool[ _]call'
+    r'|tools? (?:is|are) not supported|(?:not|n\'t) support(?:ed)? (?:for )?(?:tools|functions)',
+    re.IGNORECASE
+)
+
+# LLM提示词：固定的说明放在开头，每次调用变化的目标元素和页面摘要放在末尾，
+# 使相同的前缀能命中LLM服务端的提示词缓存
+_SYSTEM_PROMPT = "你是一个专业的网页分析专家，擅长提取DOM元素的XPath选择器。"
+
+_XPATH_REQUIREMENTS = """要求：
+1. XPath应该尽可能精确和稳定
+2. 优先使用id、class等稳定属性
+3. 避免使用绝对位置路径
+4. 考虑元素的语义和上下文"""
+
+_XPATH_INSTRUCTIONS = f"""请分析文末给出的HTML结构，为指定的元素提取准确的XPath选择器。
+
+请返回JSON格式的结果，包含每个元素的XPath：
+{{
+    "元素名": "xpath表达式",
+    ...
+}}
+
+{_XPATH_REQUIREMENTS}
+
+请只返回JSON，不要添加其他说明。
+"""
+
+# 原生工具调用：模型按函数参数的JSON Schema写出结果，提示词中不再需要JSON格式说明
+_XPATH_TOOL_NAME = "emit_xpaths"
+
+_XPATH_TOOL_INSTRUCTIONS = f"""请分析文末给出的HTML结构，为指定的元素提取准确的XPath选择器，并调用{_XPATH_TOOL_NAME}函数返回结果。
+
+{_XPATH_REQUIREMENTS}
+"""
+
+_XPATH_BATCH_INSTRUCTIONS = f"""请分析文末给出的多个页面的HTML结构，分别为每个页面指定的元素提取准确的XPath选择器。
+
+请返回JSON数组，按页面顺序每个页面一个对象，包含该页面每个元素的XPath：
+[
+    {{"元素名": "xpath表达式", ...}},
+    ...
+]
+
+{_XPATH_REQUIREMENTS}
+
+请只返回JSON数组，不要添加其他说明。
+"""
+
+
+class LLMResponseError(Exception):
+    """LLM返回的内容无法解析，或与请求的页面不对应"""
+
+
+def _matching_bracket(text: str, start: int) -> int:
+    """
+    返回与text[start]处的括号配对的闭括号位置（线性扫描，忽略JSON字符串内的括号）；
+    没有配对时返回-1
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            depth += 1
+        elif char in '}]':
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def _xpath_tool(target_elements: List[str]) -> List[Dict[str, Any]]:
+    """构造返回XPath的函数定义，每个目标元素对应一个必填的字符串参数"""
+    return [{
+        "type": "function",
+        "function": {
+            "name": _XPATH_TOOL_NAME,
+            "description": "返回每个元素的XPath表达式",
+            "parameters": {
+                "type": "object",
+                "properties": {name: {"type": "string"} for name in target_elements},
+                "required": list(target_elements)
+            }
+        }
+    }]
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_xpath(xpath: str):
+    """编译XPath表达式并缓存；同一站点的页面通常得到相同的XPath，无需每次重新解析"""
+    from lxml import etree
+    return etree.XPath(xpath)
 
 
 class AsyncXPathExtractor:
-    def __init__(self, api_key=None, api_base=None, model="Pro/deepseek-ai/DeepSeek-R1", 
+    def __init__(self, api_key=None, api_base=None, model="deepseek-ai/DeepSeek-V3", 
                  max_http_concurrent=20, max_llm_concurrent=5, max_global_concurrent=50,
-                 request_timeout=30, max_tokens=1000, temperature=0.1, connection_pool_size=100):
+                 request_timeout=30, max_tokens=1000, temperature=0.1, connection_pool_size=100,
+                 retry_count=0, content_preview_length=200, llm_cache_dir=None, llm_cache_ttl=7 * 24 * 3600,
+                 max_summary_length=8000):
         """
         初始化异步XPath提取器
         
         Args:
             api_key: API密钥（默认从环境变量SILICONFLOW_API_KEY获取）
             api_base: API基础URL（默认使用硅基流动）
-            model: 使用的模型名称
+            model: 使用的模型名称（默认为非推理模型DeepSeek-V3，XPath选择无需长推理，更快且更省token）
             max_http_concurrent: HTTP请求最大并发数
             max_llm_concurrent: LLM API调用最大并发数
-            max_global_concurrent: 全局最大并发数
+            max_global_concurrent: 全局最大并发数（仅保留配置，总并发由调用方的任务数控制）
             request_timeout: HTTP请求超时时间（秒）
             max_tokens: LLM输出最大token数
             temperature: LLM温度参数
             connection_pool_size: HTTP连接池大小
+            retry_count: 获取网页失败时的重试次数（指数退避）
+            content_preview_length: 验证结果中保留的内容预览长度（0表示不提取内容）
+            llm_cache_dir: LLM结果缓存目录（为空时不缓存；相同模型和提示词直接复用上次的结果）
+            llm_cache_ttl: LLM结果缓存有效期（秒）
+            max_summary_length: DOM结构摘要的最大字符数（限制LLM输入长度）
         """
         self.api_key = api_key or os.getenv('SILICONFLOW_API_KEY')
         self.api_base = api_base or "https://api.siliconflow.cn/v1"
@@ -47,11 +191,25 @@ class AsyncXPathExtractor:
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.connection_pool_size = connection_pool_size
+        self.retry_count = retry_count
+        self.content_preview_length = content_preview_length
+        self.llm_cache_dir = llm_cache_dir
+        self.llm_cache_ttl = llm_cache_ttl
+        self.max_summary_length = max_summary_length
+        
+        # LLM结构化输出方式，按优先级排列：工具调用、JSON输出模式、普通文本；
+        # 某种方式被模型拒绝且后续方式请求成功后，不再尝试被拒绝的方式
+        self._llm_output_modes = ['tools', 'json', 'text']
+        
+        # 多次调用共享的HTTP会话（首次使用时创建）
+        self._session_obj: Optional[aiohttp.ClientSession] = None
         
         if not self.api_key:
             print("警告：未设置API密钥。请设置环境变量 SILICONFLOW_API_KEY 或在初始化时传入api_key参数")
             return
         
+        from openai import AsyncOpenAI
+        
         self.async_client = AsyncOpenAI(
             api_key=self.api_key,
             base_url=self.api_base
@@ -60,9 +218,41 @@ class AsyncXPathExtractor:
         # 并发控制信号量
         self.http_semaphore = asyncio.Semaphore(max_http_concurrent)  # HTTP请求并发
         self.llm_semaphore = asyncio.Semaphore(max_llm_concurrent)    # LLM API并发
-        self.global_semaphore = asyncio.Semaphore(max_global_concurrent) # 全局并发控制
+        # 总任务并发由调用方控制（批处理中即常驻worker数），不再额外叠加全局信号量
+    
+    async def _session(self) -> aiohttp.ClientSession:
+        """获取共享的HTTP会话，首次调用时创建，复用连接池、DNS缓存和keep-alive连接"""
+        import aiohttp
+        
+        if self._session_obj is None or self._session_obj.closed:
+            connector = aiohttp.TCPConnector(
+                resolver=self._dns_resolver(),
+                limit=self.connection_pool_size,
+                ttl_dns_cache=3600,
+                use_dns_cache=True,
+                keepalive_timeout=60
+            )
+            self._session_obj = aiohttp.ClientSession(connector=connector)
+        return self._session_obj
+    
+    @staticmethod
+    def _dns_resolver() -> Optional[aiohttp.AsyncResolver]:
+        """安装了aiodns时使用非阻塞的c-ares DNS解析；否则返回None，使用aiohttp默认的线程池解析"""
+        import aiohttp
+        
+        try:
+            return aiohttp.AsyncResolver()
+        except RuntimeError:
+            # 未安装aiodns
+            return None
+    
+    async def aclose(self):
+        """关闭共享的HTTP会话"""
+        if self._session_obj is not None and not self._session_obj.closed:
+            await self._session_obj.close()
+        self._session_obj = None
     
-    async def fetch_webpage_async(self, session: aiohttp.ClientSession, url: str) -> Tuple[str, str]:
+    async def fetch_webpage_async(self, session: aiohttp.ClientSession, url: str) -> html.HtmlElement:
         """
         异步获取网页内容
         
@@ -71,113 +261,263 @@ class AsyncXPathExtractor:
             url: 目标URL
             
         Returns:
-            tuple: (html_content, cleaned_html)
+            HtmlElement: 已移除script和style的文档树（摘要和XPath验证共用，每个页面只解析一次）
         """
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
-        async with self.http_semaphore:
+        import aiohttp
+        from lxml import html, etree
+        
+        for attempt in range(self.retry_count + 1):
             try:
-                async with session.get(url, headers=headers, timeout=self.request_timeout) as response:
-                    response.raise_for_status()
-                    html_content = await response.text()
-                    
-                    # 使用BeautifulSoup清理和格式化HTML
-                    soup = BeautifulSoup(html_content, 'html.parser')
-                    
-                    # 移除script和style标签
-                    for script in soup(["script", "style"]):
-                        script.decompose()
-                    
-                    # 获取清理后的HTML
-                    cleaned_html = str(soup)
-                    
-                    return html_content, cleaned_html
-                    
+                async with self.http_semaphore:
+                    async with session.get(url, headers=headers, timeout=self.request_timeout) as response:
+                        response.raise_for_status()
+                        
+                        # 边下载边增量解析（解析时即丢弃注释），内存中只保留当前数据块和文档树
+                        parser = html.HTMLParser(encoding=response.charset, remove_comments=True)
+                        async for chunk in response.content.iter_chunked(65536):
+                            parser.feed(chunk)
+                        tree = parser.close()
+                        
+                        # 移除script和style标签
+                        etree.strip_elements(tree, 'script', 'style', with_tail=False)
+                        
+                        return tree
+                        
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # 网络错误、超时、429和5xx可以重试；其他4xx重试也不会成功
+                retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status == 429 or e.status >= 500
+                if not retryable or attempt == self.retry_count:
+                    raise Exception(f"获取网页失败: {str(e)}")
+                
+                # 退避等待期间不占用HTTP并发名额
+                await asyncio.sleep(0.5 * 2 ** attempt)
             except Exception as e:
                 raise Exception(f"获取网页失败: {str(e)}")
     
-    def create_dom_summary(self, html_content: str) -> str:
+    async def fetch_webpages_async(self, urls: List[str]) -> List[Any]:
+        """
+        并发获取多个网页（共用提取器的HTTP会话，同时进行的请求数受max_http_concurrent限制）
+        
+        Args:
+            urls: 目标URL列表
+            
+        Returns:
+            list: 与urls顺序一致的文档树；获取失败的位置为对应的异常对象
+        """
+        session = await self._session()
+        return await asyncio.gather(*(self.fetch_webpage_async(session, url) for url in urls),
+                                    return_exceptions=True)
+    
+    def fetch_webpages_sync(self, urls: List[str]) -> List[Any]:
+        """
+        fetch_webpages_async的同步版本：在新的事件循环中获取，结束时关闭该循环中创建的HTTP会话
+        （不能在正在运行的事件循环中调用）
+        
+        Args:
+            urls: 目标URL列表
+            
+        Returns:
+            list: 与urls顺序一致的文档树；获取失败的位置为对应的异常对象
+        """
+        async def fetch_all():
+            try:
+                return await self.fetch_webpages_async(urls)
+            finally:
+                await self.aclose()
+        
+        return asyncio.run(fetch_all())
+    
+    def create_dom_summary(self, tree: html.HtmlElement) -> str:
         """
         创建DOM结构摘要，减少LLM输入长度
         
         Args:
-            html_content: HTML内容
+            tree: 已解析的文档树
             
         Returns:
             str: DOM结构摘要
         """
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
         # 提取关键结构信息
         structure_info = []
         
         # 提取title
-        title = soup.find('title')
-        if title:
-            structure_info.append(f"<title>{title.get_text().strip()}</title>")
+        title = tree.find('.//title')
+        if title is not None:
+            structure_info.append(f"<title>{title.text_content().strip()}</title>")
+        
+        # 摘要剩余可用的字符数，用完后不再追加元素
+        budget = self.max_summary_length - sum(len(info) + 1 for info in structure_info)
         
         # 提取主要内容区域
-        for tag in soup.find_all(['h1', 'h2', 'h3', 'article', 'main', 'div'], limit=50):
-            tag_info = f"<{tag.name}"
-            
-            # 添加重要属性
-            important_attrs = ['id', 'class', 'data-*']
-            for attr in tag.attrs:
-                if attr in ['id', 'class'] or attr.startswith('data-'):
-                    tag_info += f' {attr}="{" ".join(tag.attrs[attr]) if isinstance(tag.attrs[attr], list) else tag.attrs[attr]}"'
-            
-            tag_info += ">"
-            
-            # 添加文本内容（截断）
-            text = tag.get_text().strip()
-            if text:
-                text = re.sub(r'\s+', ' ', text)[:100]
-                tag_info += text
-                if len(tag.get_text().strip()) > 100:
-                    tag_info += "..."
-            
-            tag_info += f"</{tag.name}>"
+        for count, tag in enumerate(tree.iter(*_SUMMARY_TAGS)):
+            if count == _SUMMARY_LIMIT:
+                break
+            
+            # 重要属性
+            attrs = ''.join(f' {attr}="{value}"' for attr, value in tag.attrib.items()
+                            if attr in _SUMMARY_ATTRS or attr[:5] == 'data-')
+            
+            # 文本内容（截断），每个元素只遍历一次子树
+            text = _WS_RE.sub(' ', tag.text_content().strip())
+            
+            # 既无属性也无文本的元素对定位没有帮助，不占用摘要长度
+            if not attrs and not text:
+                continue
+            
+            tag_info = f"<{tag.tag}{attrs}>{text[:100]}"
+            if len(text) > 100:
+                tag_info += "..."
+            tag_info += f"</{tag.tag}>"
+            
+            budget -= len(tag_info) + 1
+            if budget < 0:
+                break
             structure_info.append(tag_info)
         
         return "\n".join(structure_info)
     
-    async def extract_xpath_with_llm_async(self, html_content: str, target_elements: List[str]) -> Dict[str, str]:
+    async def extract_xpath_with_llm_async(self, tree: html.HtmlElement, target_elements: List[str]) -> Dict[str, str]:
         """
         异步使用LLM提取XPath
         
         Args:
-            html_content: HTML内容
+            tree: 已解析的文档树
             target_elements: 要提取的元素列表 (如: ["标题", "正文"])
             
         Returns:
             dict: 元素名称到XPath的映射
         """
-        dom_summary = self.create_dom_summary(html_content)
+        return await self.extract_xpath_from_summary_async(self.create_dom_summary(tree), target_elements)
+    
+    async def extract_xpath_from_summary_async(self, dom_summary: str, target_elements: List[str]) -> Dict[str, str]:
+        """
+        根据已生成的DOM结构摘要，异步使用LLM提取XPath
         
-        prompt = f"""
-请分析以下HTML结构，为指定的元素提取准确的XPath选择器。
+        Args:
+            dom_summary: create_dom_summary生成的页面摘要
+            target_elements: 要提取的元素列表
+            
+        Returns:
+            dict: 元素名称到XPath的映射
+        """
+        task = f"""需要提取的元素：{', '.join(target_elements)}
 
 HTML结构摘要：
 {dom_summary}
-
-需要提取的元素：{', '.join(target_elements)}
-
-请返回JSON格式的结果，包含每个元素的XPath：
-{{
-    "元素名": "xpath表达式",
-    ...
-}}
-
-要求：
-1. XPath应该尽可能精确和稳定
-2. 优先使用id、class等稳定属性
-3. 避免使用绝对位置路径
-4. 考虑元素的语义和上下文
-
-请只返回JSON，不要添加其他说明。
 """
+        
+        try:
+            return await self._request_xpath_dict(task, target_elements)
+        except Exception as e:
+            raise Exception(f"LLM分析失败: {str(e)}")
+    
+    async def _request_xpath_dict(self, task: str, target_elements: List[str]) -> Dict[str, str]:
+        """
+        按优先级依次尝试各结构化输出方式请求LLM，模型不支持当前方式（BadRequestError）时改用下一种
+        
+        Args:
+            task: 提示词中随调用变化的部分（目标元素和页面摘要）
+            target_elements: 要提取的元素列表，用于构造函数参数
+            
+        Returns:
+            dict: 元素名称到XPath的映射
+        """
+        from openai import BadRequestError
+        
+        modes = self._llm_output_modes
+        for i, mode in enumerate(modes):
+            instructions = _XPATH_TOOL_INSTRUCTIONS if mode == 'tools' else _XPATH_INSTRUCTIONS
+            prompt = f"{instructions}\n{task}"
+            
+            cached = self._llm_cache_get(prompt)
+            if cached is not None:
+                return cached
+            
+            if not hasattr(self, 'async_client'):
+                raise Exception("API客户端未初始化，请检查API密钥配置")
+            
+            kwargs = dict(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": _SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=self.temperature,
+                max_tokens=self.max_tokens
+            )
+            if mode == 'tools':
+                kwargs['tools'] = _xpath_tool(target_elements)
+                kwargs['tool_choice'] = {"type": "function", "function": {"name": _XPATH_TOOL_NAME}}
+            elif mode == 'json':
+                kwargs['response_format'] = {"type": "json_object"}
+            
+            try:
+                async with self.llm_semaphore:
+                    response = await self.async_client.chat.completions.create(**kwargs)
+            except BadRequestError as e:
+                if i == len(modes) - 1 or not _UNSUPPORTED_MODE_RE.search(str(e)):
+                    raise
+                logger.debug(f"模型 {self.model} 不支持 {mode} 输出方式，改用 {modes[i + 1]}: {e}")
+                continue
+            
+            # 之前的方式被拒绝而当前方式成功，说明模型不支持之前的方式
+            if i:
+                self._llm_output_modes = modes[i:]
+            
+            message = response.choices[0].message
+            if mode == 'tools' and message.tool_calls:
+                result_text = message.tool_calls[0].function.arguments
+            else:
+                result_text = message.content or ''
+            
+            xpath_dict = self._parse_llm_json(result_text.strip(), '{')
+            self._llm_cache_put(prompt, xpath_dict)
+            return xpath_dict
+    
+    async def extract_xpath_batch(self, summaries: List[Tuple[str, List[str]]],
+                                  batch_size: int = 8) -> List[Dict[str, str]]:
+        """
+        批量使用LLM提取XPath：每batch_size个页面合并为一次LLM调用
+        
+        Args:
+            summaries: (DOM结构摘要, 目标元素列表) 的列表
+            batch_size: 每次LLM调用包含的页面数
+            
+        Returns:
+            list: 与输入顺序一致的元素名称到XPath映射列表
+        """
+        groups = [summaries[i:i + batch_size] for i in range(0, len(summaries), batch_size)]
+        results = await asyncio.gather(*(self._extract_xpath_group_async(group) for group in groups))
+        return [xpath_dict for group_result in results for xpath_dict in group_result]
+    
+    async def _extract_xpath_group_async(self, group: List[Tuple[str, List[str]]]) -> List[Dict[str, str]]:
+        """对一组页面发起一次LLM调用，返回按页面顺序排列的XPath映射"""
+        shared_elements = group[0][1]
+        if all(target_elements == shared_elements for _, target_elements in group):
+            # 各页面目标元素相同时只在提示词中列出一次（放在页面之前，作为共同前缀的一部分）
+            pages = "\n\n".join(
+                f"页面{i}：\nHTML结构摘要：\n{dom_summary}"
+                for i, (dom_summary, _) in enumerate(group, 1)
+            )
+            pages = f"每个页面需要提取的元素：{', '.join(shared_elements)}\n\n共{len(group)}个页面。\n\n{pages}"
+        else:
+            pages = "\n\n".join(
+                f"页面{i}：\nHTML结构摘要：\n{dom_summary}\n需要提取的元素：{', '.join(target_elements)}"
+                for i, (dom_summary, target_elements) in enumerate(group, 1)
+            )
+            pages = f"共{len(group)}个页面。\n\n{pages}"
+        
+        prompt = f"""{_XPATH_BATCH_INSTRUCTIONS}
+{pages}
+"""
+        
+        cached = self._llm_cache_get(prompt)
+        if cached is not None:
+            return cached
 
         async with self.llm_semaphore:
             try:
@@ -187,60 +527,121 @@ HTML结构摘要：
                 response = await self.async_client.chat.completions.create(
                     model=self.model,
                     messages=[
-                        {"role": "system", "content": "你是一个专业的网页分析专家，擅长提取DOM元素的XPath选择器。"},
+                        {"role": "system", "content": _SYSTEM_PROMPT},
                         {"role": "user", "content": prompt}
                     ],
                     temperature=self.temperature,
-                    max_tokens=self.max_tokens
+                    # 输出长度随页面数增长
+                    max_tokens=self.max_tokens * len(group)
                 )
                 
                 result_text = response.choices[0].message.content.strip()
+                xpath_dicts = self._parse_llm_json(result_text, '[')
                 
-                # 尝试解析JSON
-                try:
-                    return json.loads(result_text)
-                except json.JSONDecodeError:
-                    # 如果不是标准JSON，尝试提取JSON部分
-                    json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-                    if json_match:
-                        return json.loads(json_match.group())
-                    else:
-                        raise Exception("LLM返回的不是有效的JSON格式")
+                if not isinstance(xpath_dicts, list) or len(xpath_dicts) != len(group):
+                    raise LLMResponseError("LLM返回的结果数量与页面数量不一致")
+                if not all(isinstance(xpath_dict, dict) for xpath_dict in xpath_dicts):
+                    raise LLMResponseError("LLM返回的结果不是元素名称到XPath的映射")
+                
+                self._llm_cache_put(prompt, xpath_dicts)
+                return xpath_dicts
                         
+            except LLMResponseError as e:
+                raise LLMResponseError(f"LLM分析失败: {str(e)}")
             except Exception as e:
                 raise Exception(f"LLM分析失败: {str(e)}")
     
-    def validate_xpath(self, html_content: str, xpath_dict: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    def _llm_cache_path(self, prompt: str) -> Optional[str]:
+        """LLM结果缓存文件路径，按(模型, 系统提示词, 提示词)的SHA-256命名；未启用缓存时返回None"""
+        if not self.llm_cache_dir:
+            return None
+        key = hashlib.sha256("\0".join((self.model, _SYSTEM_PROMPT, prompt)).encode('utf-8')).hexdigest()
+        return os.path.join(self.llm_cache_dir, f"{key}.json")
+    
+    def _llm_cache_get(self, prompt: str) -> Any:
+        """读取未过期的LLM结果缓存，未命中时返回None"""
+        path = self._llm_cache_path(prompt)
+        if path is None:
+            return None
+        try:
+            if time.time() - os.path.getmtime(path) > self.llm_cache_ttl:
+                return None
+            with open(path, 'rb') as f:
+                return _json_loads(f.read())
+        except (OSError, ValueError):
+            # 缓存不存在或已损坏，按未命中处理
+            return None
+    
+    def _llm_cache_put(self, prompt: str, result: Any):
+        """写入LLM结果缓存（先写临时文件再替换，避免读到不完整的缓存）"""
+        path = self._llm_cache_path(prompt)
+        if path is None:
+            return
+        try:
+            os.makedirs(self.llm_cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            # 缓存写入失败不影响提取结果
+            pass
+    
+    @staticmethod
+    def _parse_llm_json(result_text: str, opener: str) -> Any:
+        """解析LLM返回的JSON；不是标准JSON时提取其中第一个以opener（'{'或'['）开头、括号配对且可解析的片段"""
+        # 先去掉常见的```json代码块标记
+        text = result_text.strip().removeprefix('```json').removeprefix('```').removesuffix('```').strip()
+        try:
+            return _json_loads(text)
+        except json.JSONDecodeError:
+            pass
+        
+        # 如果不是标准JSON，按括号配对提取JSON部分（跳过说明文字中无法解析的片段）
+        start = text.find(opener)
+        while start != -1:
+            end = _matching_bracket(text, start)
+            if end == -1:
+                break
+            try:
+                return _json_loads(text[start:end + 1])
+            except json.JSONDecodeError:
+                start = text.find(opener, start + 1)
+        raise LLMResponseError("LLM返回的不是有效的JSON格式")
+    
+    def validate_xpath(self, tree: html.HtmlElement, xpath_dict: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
         """
         验证XPath的有效性（同步方法，因为lxml是同步的）
         
         Args:
-            html_content: HTML内容
+            tree: 已解析的文档树
             xpath_dict: XPath字典
             
         Returns:
             dict: 验证结果
         """
-        from lxml import html, etree
-        
         try:
-            tree = html.fromstring(html_content)
             results = {}
+            preview_length = self.content_preview_length
             
             for element_name, xpath in xpath_dict.items():
                 try:
-                    elements = tree.xpath(xpath)
+                    elements = _compile_xpath(xpath)(tree)
                     if elements:
-                        # 获取元素文本内容
-                        if hasattr(elements[0], 'text_content'):
+                        # 获取元素文本内容，只保留预览部分，结果中不持有整段正文
+                        if not preview_length:
+                            content = None
+                        elif hasattr(elements[0], 'text_content'):
                             content = elements[0].text_content().strip()
                         else:
                             content = str(elements[0]).strip()
+                        if content is not None and len(content) > preview_length:
+                            content = content[:preview_length] + "..."
                         
                         results[element_name] = {
                             "xpath": xpath,
                             "found": True,
-                            "content": content[:200] + "..." if len(content) > 200 else content,
+                            "content": content,
                             "element_count": len(elements)
                         }
                     else:
@@ -263,70 +664,93 @@ HTML结构摘要：
         except Exception as e:
             raise Exception(f"XPath验证失败: {str(e)}")
     
-    async def extract_xpath_async(self, url: str, target_elements: List[str]) -> Dict[str, Any]:
+    async def extract_xpath_async(self, url: str, target_elements: List[str],
+                                  session: Optional[aiohttp.ClientSession] = None) -> Dict[str, Any]:
         """
         异步主要提取方法
         
         Args:
             url: 目标URL
             target_elements: 要提取的元素列表
+            session: 复用的aiohttp会话（为空时使用提取器共享的会话）
             
         Returns:
             dict: 完整的提取结果
         """
-        async with self.global_semaphore:
-            start_time = time.time()
+        start_time = time.monotonic()
+        
+        logger.info(f"正在分析URL: {url}")
+        logger.info(f"目标元素: {', '.join(target_elements)}")
+        logger.info("-" * 50)
+        
+        if session is None:
+            session = await self._session()
+        
+        return await self._extract_with_session(session, url, target_elements, start_time)
+    
+    async def extract_xpaths_async(self, jobs: List[Tuple[str, List[str]]]) -> List[Dict[str, Any]]:
+        """
+        并发处理多个URL：每个URL的获取、LLM分析和验证独立进行，
+        不同URL的网络请求和LLM调用相互重叠（并发数仍受HTTP和LLM信号量限制）
+        
+        Args:
+            jobs: (URL, 目标元素列表) 的列表
             
-            print(f"正在分析URL: {url}")
-            print(f"目标元素: {', '.join(target_elements)}")
-            print("-" * 50)
+        Returns:
+            list: 与jobs顺序一致的提取结果（失败的URL返回status为error的结果）
+        """
+        session = await self._session()
+        return await asyncio.gather(*(
+            self._extract_with_session(session, url, target_elements, time.monotonic())
+            for url, target_elements in jobs
+        ))
+    
+    async def _extract_with_session(self, session: aiohttp.ClientSession, url: str,
+                                    target_elements: List[str], start_time: float) -> Dict[str, Any]:
+        """使用给定会话执行获取、LLM分析和验证流程"""
+        try:
+            # 1. 获取网页内容
+            tree = await self.fetch_webpage_async(session, url)
+            logger.info("✓ 网页内容获取成功")
             
-            # 创建aiohttp会话，配置连接池
-            connector = aiohttp.TCPConnector(limit=self.connection_pool_size)
-            async with aiohttp.ClientSession(connector=connector) as session:
-                try:
-                    # 1. 获取网页内容
-                    raw_html, cleaned_html = await self.fetch_webpage_async(session, url)
-                    print("✓ 网页内容获取成功")
-                    
-                    # 2. 使用LLM提取XPath
-                    xpath_dict = await self.extract_xpath_with_llm_async(cleaned_html, target_elements)
-                    print("✓ XPath提取完成")
-                    
-                    # 3. 验证XPath（同步操作，但很快）
-                    validation_results = self.validate_xpath(cleaned_html, xpath_dict)
-                    print("✓ XPath验证完成")
-                    
-                    processing_time = time.time() - start_time
-                    
-                    return {
-                        "url": url,
-                        "target_elements": target_elements,
-                        "xpath_results": validation_results,
-                        "processing_time": round(processing_time, 2),
-                        "status": "success",
-                        "summary": {
-                            "total_elements": len(target_elements),
-                            "successful_extractions": sum(1 for r in validation_results.values() if r.get("found", False)),
-                            "failed_extractions": sum(1 for r in validation_results.values() if not r.get("found", False))
-                        }
-                    }
-                    
-                except Exception as e:
-                    processing_time = time.time() - start_time
-                    return {
-                        "url": url,
-                        "target_elements": target_elements,
-                        "status": "error",
-                        "error": str(e),
-                        "processing_time": round(processing_time, 2),
-                        "xpath_results": {},
-                        "summary": {
-                            "total_elements": len(target_elements),
-                            "successful_extractions": 0,
-                            "failed_extractions": len(target_elements)
-                        }
-                    }
+            # 2. 使用LLM提取XPath
+            xpath_dict = await self.extract_xpath_with_llm_async(tree, target_elements)
+            logger.info("✓ XPath提取完成")
+            
+            # 3. 验证XPath（同步操作，但很快）
+            validation_results = self.validate_xpath(tree, xpath_dict)
+            logger.info("✓ XPath验证完成")
+            
+            processing_time = time.monotonic() - start_time
+            
+            return {
+                "url": url,
+                "target_elements": target_elements,
+                "xpath_results": validation_results,
+                "processing_time": round(processing_time, 2),
+                "status": "success",
+                "summary": {
+                    "total_elements": len(target_elements),
+                    "successful_extractions": sum(1 for r in validation_results.values() if r.get("found", False)),
+                    "failed_extractions": sum(1 for r in validation_results.values() if not r.get("found", False))
+                }
+            }
+            
+        except Exception as e:
+            processing_time = time.monotonic() - start_time
+            return {
+                "url": url,
+                "target_elements": target_elements,
+                "status": "error",
+                "error": str(e),
+                "processing_time": round(processing_time, 2),
+                "xpath_results": {},
+                "summary": {
+                    "total_elements": len(target_elements),
+                    "successful_extractions": 0,
+                    "failed_extractions": len(target_elements)
+                }
+            }
 
 
 async def main_async():
@@ -339,6 +763,9 @@ async def main_async():
     url = sys.argv[1]
     target_elements = sys.argv[2:]
     
+    # 单URL模式下直接输出处理步骤
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+    
     # 初始化提取器（需要配置API密钥）
     extractor = AsyncXPathExtractor()
     
@@ -378,6 +805,8 @@ async def main_async():
     except Exception as e:
         print(f"错误: {str(e)}")
         sys.exit(1)
+    finally:
+        await extractor.aclose()
 
 
 if __name__ == "__main__":
@@ -5,15 +5,145 @@
 
 import json
 import os
+import re
 import sys
+from collections import OrderedDict
+from types import MappingProxyType
 from typing import Dict, Any, List, Optional
 from pathlib import Path
 
+# 可选：使用orjson加速大型配置文件的解析和写出（输出为缩进2格的UTF-8字节）
+try:
+    import orjson
+    _json_loads = orjson.loads
+    
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    _json_loads = json.loads
+    
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+
+# 可选：使用fastjsonschema把配置schema编译为校验函数（未安装时使用逐字段检查）
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+# URL格式：协议 + 非空主机，之后可跟路径、查询或片段（批量处理器也使用此正则）
+_URL_RE = re.compile(r'[A-Za-z][A-Za-z0-9+.-]*://[^\s/?#]+(?:[/?#]\S*)?')
+
+# 配置文件顶层字段的检查表：(字段名, JSON类型, 最小值, 最大值)
+_FIELD_SPECS = [
+    ("target_elements", "array", None, None),
+    ("max_concurrent", "integer", 1, None),
+    ("request_timeout", "integer", None, None),
+    ("retry_count", "integer", None, None),
+    ("use_async", "boolean", None, None),
+    ("max_http_concurrent", "integer", 1, None),
+    ("max_llm_concurrent", "integer", 1, None),
+    ("max_global_concurrent", "integer", 1, None),
+    ("max_tokens", "integer", 1, None),
+    ("temperature", "number", 0, 2),
+    ("batch_rest_time", "number", 0, None),
+    ("batch_size", "integer", 1, None),
+    ("worker_processes", "integer", 0, None),
+    ("llm_batch_size", "integer", 1, None),
+    ("use_cache", "boolean", None, None),
+    ("cache_db", "string", None, None),
+    ("cache_ttl", "number", 0, None),
+    ("llm_cache_dir", "string", None, None),
+]
+
+# JSON类型 -> (对应的Python类型, 错误信息中的名称)
+_FIELD_TYPES = {
+    "array": (list, "列表"),
+    "integer": (int, "整数"),
+    "number": ((int, float), "数字"),
+    "boolean": (bool, "布尔值"),
+    "string": (str, "字符串"),
+}
+
+_OUTPUT_FORMATS = ("csv", "parquet")
+
+
+def _field_schema(json_type: str, minimum, maximum) -> Dict[str, Any]:
+    schema = {"type": json_type}
+    if minimum is not None:
+        schema["minimum"] = minimum
+    if maximum is not None:
+        schema["maximum"] = maximum
+    return schema
+
+
+# 由检查表生成的JSON Schema（供fastjsonschema编译）
+_CONFIG_SCHEMA = {
+    "type": "object",
+    "required": ["target_elements"],
+    "properties": {
+        **{name: _field_schema(json_type, lo, hi) for name, json_type, lo, hi in _FIELD_SPECS},
+        "output_format": {
+            "type": "object",
+            "properties": {"format": {"enum": list(_OUTPUT_FORMATS)}}
+        }
+    }
+}
+
 
 class ConfigManager:
     """配置文件管理器"""
     
+    # 已加载的配置：配置文件绝对路径 -> (文件键, 所用URL文件的文件键, 标准化后的配置)
+    # 文件键为(绝对路径, 修改时间, 文件大小)，修改时间精度不足时文件大小的变化也能使缓存失效
+    # 两个缓存都按绝对路径只保留最新一项，并按最近使用淘汰，最多各保留_CACHE_MAX_ENTRIES个文件
+    _config_cache: OrderedDict = OrderedDict()
+    
+    # 已读取的URL文件：URL文件绝对路径 -> (文件键, 有效URL)
+    _url_file_cache: OrderedDict = OrderedDict()
+    _CACHE_MAX_ENTRIES = 32
+    
+    # 配置默认值（max_concurrent为None表示按运行环境计算，见_default_max_concurrent；llm_cache_dir为None表示不缓存）
+    _DEFAULTS = MappingProxyType({
+        "max_concurrent": None,
+        "request_timeout": 30,
+        "llm_timeout": 60,
+        "retry_count": 3,
+        "output_file": "batch_results.csv",
+        "model": "deepseek-ai/DeepSeek-V3",
+        "api_base": "https://api.siliconflow.cn/v1",
+        "use_async": True,
+        "max_http_concurrent": 20,
+        "max_llm_concurrent": 5,
+        "max_global_concurrent": 50,
+        "batch_size": 10,
+        "connection_pool_size": 100,
+        "max_tokens": 1000,
+        "temperature": 0.1,
+        "batch_rest_time": 0.1,
+        "worker_processes": 1,
+        "llm_batch_size": 1,
+        "use_cache": False,
+        "cache_db": ".xpath_cache.sqlite",
+        "cache_ttl": 7 * 24 * 3600,
+        "llm_cache_dir": None
+    })
+    
+    # 默认输出格式
+    _DEFAULT_OUTPUT_FORMAT = MappingProxyType({
+        "include_content_preview": True,
+        "max_content_length": 200,
+        "include_element_count": True,
+        "include_processing_time": True
+    })
+    
+    # 由_CONFIG_SCHEMA编译的校验函数（所有实例共享，只编译一次）
+    _validator = None
+    
     def __init__(self):
+        if fastjsonschema is not None and ConfigManager._validator is None:
+            ConfigManager._validator = staticmethod(fastjsonschema.compile(_CONFIG_SCHEMA))
+        
         self.config_schema = {
             "required_fields": ["target_elements"],
             "optional_fields": [
@@ -22,7 +152,9 @@ class ConfigManager:
                 "exclude_urls_file", "output_format", "api_key", 
                 "api_base", "model", "use_async", "max_http_concurrent",
                 "max_llm_concurrent", "max_global_concurrent", "batch_size", 
-                "connection_pool_size", "max_tokens", "temperature", "batch_rest_time"
+                "connection_pool_size", "max_tokens", "temperature", "batch_rest_time",
+                "worker_processes", "llm_batch_size", "use_cache", "cache_db",
+                "cache_ttl", "llm_cache_dir"
             ]
         }
     
@@ -37,16 +169,20 @@ class ConfigManager:
             配置字典
         """
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            
-            # 验证配置
-            self._validate_config(config)
+            # 同一进程内重复加载未修改的配置文件时直接使用缓存（返回副本，调用方可随意修改）；
+            # 配置文件或其引用的URL文件有变化时重新加载
+            key = self._file_key(config_path)
+            cached = self._config_cache.get(key[0])
+            if cached is None or cached[0] != key or not self._files_unchanged(cached[1]):
+                config = self._load_config_uncached(config_path)
+                url_files = tuple(self._file_key(self._resolve_url_file(config[name]))
+                                  for name in ("urls_file", "exclude_urls_file") if name in config)
+                # URL列表在缓存中保存为元组，防止被调用方修改
+                config["urls"] = tuple(config["urls"])
+                cached = (key, url_files, config)
+            self._cache_store(self._config_cache, key[0], cached)
             
-            # 处理不同配置格式
-            config = self._normalize_config(config, config_path)
-            
-            return config
+            return self._copy_config(cached[2])
             
         except FileNotFoundError:
             raise Exception(f"配置文件未找到: {config_path}")
@@ -55,112 +191,99 @@ class ConfigManager:
         except Exception as e:
             raise Exception(f"加载配置文件失败: {str(e)}")
     
+    @staticmethod
+    def _copy_config(config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        复制缓存的配置：URL等字符串不可变，直接共享；只复制第一层的列表和字典
+        （配置中嵌套的settings、output_format等都只有一层），代替整体deepcopy
+        """
+        return {
+            key: list(value) if isinstance(value, (list, tuple))
+            else dict(value) if isinstance(value, dict)
+            else value
+            for key, value in config.items()
+        }
+    
+    @classmethod
+    def _cache_store(cls, cache: OrderedDict, path: str, entry: tuple):
+        """写入（或刷新）路径对应的缓存项，超出上限时淘汰最久未使用的文件"""
+        cache[path] = entry
+        cache.move_to_end(path)
+        while len(cache) > cls._CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
+    
+    @staticmethod
+    def _file_key(path: str) -> tuple:
+        """文件缓存键：(绝对路径, 修改时间, 文件大小)"""
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    
+    def _files_unchanged(self, file_keys: tuple) -> bool:
+        """检查文件自记录文件键以来是否未被修改"""
+        try:
+            return all(self._file_key(key[0]) == key for key in file_keys)
+        except OSError:
+            return False
+    
+    def _load_config_uncached(self, config_path: str) -> Dict[str, Any]:
+        """读取、验证并标准化配置文件"""
+        with open(config_path, 'rb') as f:
+            config = _json_loads(f.read())
+        
+        # 验证配置
+        self._validate_config(config)
+        
+        # 处理不同配置格式
+        return self._normalize_config(config, config_path)
+    
     def _validate_config(self, config: Dict[str, Any]):
         """验证配置文件格式"""
+        if self._validator is not None:
+            try:
+                self._validator(config)
+            except fastjsonschema.JsonSchemaException as e:
+                raise Exception(f"配置文件校验失败: {e.message}")
+        else:
+            self._validate_fields(config)
+        
+        if config.get("max_concurrent", 0) > 512:
+            print(f"警告: max_concurrent={config['max_concurrent']} 过大，可能被目标网站或API限流")
+    
+    def _validate_fields(self, config: Dict[str, Any]):
+        """逐字段验证配置（未安装fastjsonschema时使用）"""
         # 检查必需字段
         for field in self.config_schema["required_fields"]:
             if field not in config:
                 raise Exception(f"配置文件缺少必需字段: {field}")
         
-        # 验证字段类型
-        if "target_elements" in config and not isinstance(config["target_elements"], list):
-            raise Exception("target_elements 必须是列表")
-        
-        if "max_concurrent" in config and not isinstance(config["max_concurrent"], int):
-            raise Exception("max_concurrent 必须是整数")
-        
-        if "max_concurrent" in config and config["max_concurrent"] < 1:
-            raise Exception("max_concurrent 必须大于0")
-        
-        if "request_timeout" in config and not isinstance(config["request_timeout"], int):
-            raise Exception("request_timeout 必须是整数")
-        
-        if "retry_count" in config and not isinstance(config["retry_count"], int):
-            raise Exception("retry_count 必须是整数")
-        
-        # 验证异步配置参数
-        if "use_async" in config and not isinstance(config["use_async"], bool):
-            raise Exception("use_async 必须是布尔值")
-        
-        if "max_http_concurrent" in config and not isinstance(config["max_http_concurrent"], int):
-            raise Exception("max_http_concurrent 必须是整数")
-        
-        if "max_http_concurrent" in config and config["max_http_concurrent"] < 1:
-            raise Exception("max_http_concurrent 必须大于0")
-        
-        if "max_llm_concurrent" in config and not isinstance(config["max_llm_concurrent"], int):
-            raise Exception("max_llm_concurrent 必须是整数")
-        
-        if "max_llm_concurrent" in config and config["max_llm_concurrent"] < 1:
-            raise Exception("max_llm_concurrent 必须大于0")
-        
-        if "max_global_concurrent" in config and not isinstance(config["max_global_concurrent"], int):
-            raise Exception("max_global_concurrent 必须是整数")
-        
-        if "max_global_concurrent" in config and config["max_global_concurrent"] < 1:
-            raise Exception("max_global_concurrent 必须大于0")
-        
-        if "max_tokens" in config and not isinstance(config["max_tokens"], int):
-            raise Exception("max_tokens 必须是整数")
-        
-        if "max_tokens" in config and config["max_tokens"] < 1:
-            raise Exception("max_tokens 必须大于0")
-        
-        if "temperature" in config and not isinstance(config["temperature"], (int, float)):
-            raise Exception("temperature 必须是数字")
-        
-        if "temperature" in config and (config["temperature"] < 0 or config["temperature"] > 2):
-            raise Exception("temperature 必须在0-2之间")
-        
-        if "batch_rest_time" in config and not isinstance(config["batch_rest_time"], (int, float)):
-            raise Exception("batch_rest_time 必须是数字")
-        
-        if "batch_rest_time" in config and config["batch_rest_time"] < 0:
-            raise Exception("batch_rest_time 必须大于等于0")
-        
-        if "batch_size" in config and not isinstance(config["batch_size"], int):
-            raise Exception("batch_size 必须是整数")
-        
-        if "batch_size" in config and config["batch_size"] < 1:
-            raise Exception("batch_size 必须大于0")
+        # 按检查表验证字段类型和取值范围（布尔值不算作整数或数字）
+        for name, json_type, lo, hi in _FIELD_SPECS:
+            if name not in config:
+                continue
+            value = config[name]
+            expected, type_name = _FIELD_TYPES[json_type]
+            if not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool):
+                raise Exception(f"{name} 必须是{type_name}")
+            if lo is not None and hi is not None:
+                if not lo <= value <= hi:
+                    raise Exception(f"{name} 必须在{lo}-{hi}之间")
+            elif lo is not None and value < lo:
+                raise Exception(f"{name} 必须大于等于{lo}")
+        
+        if config.get("output_format", {}).get("format", "csv") not in _OUTPUT_FORMATS:
+            raise Exception("output_format.format 必须是 csv 或 parquet")
     
     def _normalize_config(self, config: Dict[str, Any], config_path: str) -> Dict[str, Any]:
         """标准化配置格式"""
-        # 设置默认值
-        defaults = {
-            "max_concurrent": 5,
-            "request_timeout": 30,
-            "llm_timeout": 60,
-            "retry_count": 3,
-            "output_file": "batch_results.csv",
-            "model": "Pro/deepseek-ai/DeepSeek-R1",
-            "api_base": "https://api.siliconflow.cn/v1",
-            "use_async": True,
-            "max_http_concurrent": 20,
-            "max_llm_concurrent": 5,
-            "max_global_concurrent": 50,
-            "batch_size": 10,
-            "connection_pool_size": 100,
-            "max_tokens": 1000,
-            "temperature": 0.1,
-            "batch_rest_time": 0.1
-        }
-        
-        # 应用默认值
-        for key, value in defaults.items():
-            if key not in config:
-                # 如果有settings对象，优先从settings中获取
-                if "settings" in config and key in config["settings"]:
-                    config[key] = config["settings"][key]
-                else:
-                    config[key] = value
-        
-        # 处理settings对象中的配置
-        if "settings" in config:
-            settings = config["settings"]
-            for key, value in settings.items():
-                if key in defaults:
-                    config[key] = value
+        # 应用默认值：settings对象中的配置优先，其次是顶层字段，最后是默认值
+        settings = config.get("settings", {})
+        for key, value in self._DEFAULTS.items():
+            if key in settings:
+                config[key] = settings[key]
+            elif key not in config:
+                config[key] = value
+        if config["max_concurrent"] is None:
+            config["max_concurrent"] = self._default_max_concurrent()
         
         # 处理URL来源
         urls = []
@@ -179,73 +302,91 @@ class ConfigManager:
             else:
                 raise Exception("urls_file 必须是字符串")
         
-        # 去重
-        config["urls"] = list(set(urls))
+        # 保序去重
+        config["urls"] = list(dict.fromkeys(urls))
         
         # 处理排除URL
         if "exclude_urls_file" in config:
-            exclude_urls = self._load_urls_from_file(config["exclude_urls_file"])
+            # 转为集合，使每个URL的排除判断为O(1)
+            exclude_urls = frozenset(self._load_urls_from_file(config["exclude_urls_file"]))
             config["urls"] = [url for url in config["urls"] if url not in exclude_urls]
         
-        # 验证URL格式
-        config["urls"] = [url for url in config["urls"] if self._validate_url(url)]
+        # 验证URL格式（预编译正则的匹配方法绑定为局部变量，省去逐个URL的方法调用）
+        is_url = _URL_RE.fullmatch
+        config["urls"] = [url for url in config["urls"] if is_url(url)]
         
         # 设置默认输出格式
         if "output_format" not in config:
-            config["output_format"] = {
-                "include_content_preview": True,
-                "max_content_length": 200,
-                "include_element_count": True,
-                "include_processing_time": True
-            }
+            config["output_format"] = dict(self._DEFAULT_OUTPUT_FORMAT)
         
         return config
     
+    def _default_max_concurrent(self) -> int:
+        """默认并发数：任务以网络I/O为主，按CPU核数的5倍估算；可通过环境变量 XPATH_MAX_CONCURRENT 覆盖"""
+        env_value = os.environ.get("XPATH_MAX_CONCURRENT")
+        if env_value:
+            try:
+                return max(1, int(env_value))
+            except ValueError:
+                print(f"警告: 环境变量 XPATH_MAX_CONCURRENT 不是整数，已忽略: {env_value}")
+        return (os.cpu_count() or 4) * 5
+    
     def _load_urls_from_file(self, file_path: str) -> List[str]:
-        """从文件加载URL列表"""
-        urls = []
-        
-        # 处理相对路径
-        if not os.path.isabs(file_path):
-            # 相对于配置文件所在目录
-            config_dir = os.path.dirname(os.path.abspath(file_path))
-            file_path = os.path.join(config_dir, file_path)
+        """从文件加载URL列表（文件未修改时直接使用上次的结果）"""
+        file_path = self._resolve_url_file(file_path)
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line_num, line in enumerate(f, 1):
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        if self._validate_url(line):
-                            urls.append(line)
-                        else:
-                            print(f"警告: 第{line_num}行跳过无效URL: {line}")
+            key = self._file_key(file_path)
+            cached = self._url_file_cache.get(key[0])
+            if cached is not None and cached[0] == key:
+                self._url_file_cache.move_to_end(key[0])
+                return list(cached[1])
+            
+            # 一次读入整个文件再切分行
+            with open(file_path, 'rb') as f:
+                data = f.read()
         except FileNotFoundError:
             raise Exception(f"URL文件未找到: {file_path}")
         except Exception as e:
             raise Exception(f"读取URL文件失败: {str(e)}")
         
+        try:
+            lines = data.decode('utf-8').splitlines()
+        except UnicodeDecodeError as e:
+            line_num = data.count(b'\n', 0, e.start) + 1
+            raise Exception(f"读取URL文件失败: {file_path} 第{line_num}行不是有效的UTF-8: {str(e)}")
+        candidates = [l for l in (s.strip() for s in lines) if l and l[0] != '#']
+        # 直接使用预编译正则，省去逐行的函数调用和缓存查找
+        is_url = _URL_RE.fullmatch
+        urls = [l for l in candidates if is_url(l)]
+        
+        # 无效URL只汇总输出一次警告
+        skipped = len(candidates) - len(urls)
+        if skipped:
+            print(f"警告: {file_path} 中跳过 {skipped} 个无效URL")
+        
+        self._cache_store(self._url_file_cache, key[0], (key, tuple(urls)))
         return urls
     
-    def _validate_url(self, url: str) -> bool:
-        """验证URL格式"""
-        try:
-            from urllib.parse import urlparse
-            result = urlparse(url)
-            return all([result.scheme, result.netloc])
-        except:
-            return False
+    @staticmethod
+    def _resolve_url_file(file_path: str) -> str:
+        """处理URL文件的相对路径"""
+        if not os.path.isabs(file_path):
+            # 相对于配置文件所在目录
+            config_dir = os.path.dirname(os.path.abspath(file_path))
+            file_path = os.path.join(config_dir, file_path)
+        return file_path
     
     def create_template_config(self, output_path: str):
         """创建配置文件模板"""
         template = {
             "settings": {
-                "max_concurrent": 10,
+                "max_concurrent": self._default_max_concurrent(),
                 "request_timeout": 30,
                 "llm_timeout": 60,
                 "retry_count": 3,
                 "output_file": "async_batch_results.csv",
-                "model": "Pro/deepseek-ai/DeepSeek-R1",
+                "model": "deepseek-ai/DeepSeek-V3",
                 "use_async": True,
                 "max_http_concurrent": 20,
                 "max_llm_concurrent": 5,
@@ -254,7 +395,9 @@ class ConfigManager:
                 "connection_pool_size": 100,
                 "max_tokens": 1000,
                 "temperature": 0.1,
-                "batch_rest_time": 0.1
+                "batch_rest_time": 0.1,
+                "worker_processes": 1,
+                "llm_batch_size": 1
             },
             "target_elements": [
                 "标题",
@@ -276,8 +419,8 @@ class ConfigManager:
         }
         
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(template, f, indent=2, ensure_ascii=False)
+            with open(output_path, 'wb') as f:
+                f.write(_json_dumps(template))
             print("配置文件模板已创建: {}".format(output_path))
         except Exception as e:
             raise Exception("创建配置文件模板失败: {}".format(str(e)))
@@ -287,31 +430,35 @@ class ConfigManager:
         try:
             config = self.load_config(config_path)
             
+            # 标准化后的配置已包含全部默认值，直接按键读取
+            urls = config["urls"]
+            target_elements = config["target_elements"]
+            output_file = config["output_file"]
+            
             # 检查URL列表
-            if not config.get("urls"):
+            if not urls:
                 print("警告: 配置文件中没有有效的URL")
                 return False
             
             # 检查目标元素
-            if not config.get("target_elements"):
+            if not target_elements:
                 print("警告: 配置文件中没有目标元素")
                 return False
             
             # 检查输出目录
-            output_file = config.get("output_file", "batch_results.csv")
-            output_dir = os.path.dirname(output_file) if os.path.dirname(output_file) else "."
+            output_dir = os.path.dirname(output_file) or "."
             if not os.path.exists(output_dir):
                 print(f"警告: 输出目录不存在: {output_dir}")
             
             print("OK 配置文件验证通过")
-            print(f"  - URL数量: {len(config['urls'])}")
-            print(f"  - 目标元素: {len(config['target_elements'])}")
-            print(f"  - 异步模式: {'启用' if config.get('use_async', True) else '禁用'}")
+            print(f"  - URL数量: {len(urls)}")
+            print(f"  - 目标元素: {len(target_elements)}")
+            print(f"  - 异步模式: {'启用' if config['use_async'] else '禁用'}")
             print(f"  - 并发数: {config['max_concurrent']}")
-            print(f"  - HTTP并发: {config.get('max_http_concurrent', 20)}")
-            print(f"  - LLM并发: {config.get('max_llm_concurrent', 5)}")
-            print(f"  - 批处理大小: {config.get('batch_size', 10)}")
-            print(f"  - 输出文件: {config['output_file']}")
+            print(f"  - HTTP并发: {config['max_http_concurrent']}")
+            print(f"  - LLM并发: {config['max_llm_concurrent']}")
+            print(f"  - 批处理大小: {config['batch_size']}")
+            print(f"  - 输出文件: {output_file}")
             
             return True
             
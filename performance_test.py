@@ -8,11 +8,19 @@ import time
 import sys
 import os
 import json
-import psutil
-import threading
 from typing import List, Dict, Any
 from datetime import datetime
 
+# 可选：使用orjson加速测试结果的写出
+try:
+    import orjson
+    
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+
 # 导入同步和异步模块
 from batch_extractor import BatchXPathExtractor
 from async_batch_extractor import AsyncBatchXPathExtractor
@@ -25,14 +33,20 @@ class PerformanceTester:
     def __init__(self):
         self.test_results = []
         
+        # psutil只在性能测试中使用，创建测试器时才导入
+        import psutil
+        self._psutil = psutil
+        self._process = psutil.Process(os.getpid())
+        # 先取一次CPU快照，之后的cpu_percent调用直接返回距上次调用的使用率，不再阻塞等待
+        psutil.cpu_percent(interval=None)
+        
     def get_memory_usage(self) -> float:
         """获取当前内存使用量（MB）"""
-        process = psutil.Process(os.getpid())
-        return process.memory_info().rss / 1024 / 1024
+        return self._process.memory_info().rss / 1048576
     
     def get_cpu_usage(self) -> float:
-        """获取当前CPU使用率"""
-        return psutil.cpu_percent(interval=0.1)
+        """获取距上次调用以来的CPU使用率（不阻塞）"""
+        return self._psutil.cpu_percent(interval=None)
     
     def create_test_config(self, num_urls: int, use_async: bool = True) -> Dict[str, Any]:
         """创建测试配置"""
@@ -59,12 +73,13 @@ class PerformanceTester:
             "llm_timeout": 60,
             "retry_count": 1,  # 减少重试以加快测试
             "output_file": f"test_results_{'async' if use_async else 'sync'}.csv",
-            "model": "Pro/deepseek-ai/DeepSeek-R1",
+            "model": "deepseek-ai/DeepSeek-V3",
             "use_async": use_async,
             "max_http_concurrent": 10 if use_async else 5,
             "max_llm_concurrent": 3 if use_async else 2,
             "batch_size": 5,
             "connection_pool_size": 50,
+            "use_cache": False,  # 每次计时都真实抓取和调用LLM
             "target_elements": ["标题", "内容"],
             "urls": urls,
             "output_format": {
@@ -94,7 +109,7 @@ class PerformanceTester:
             target_elements = config["target_elements"]
             
             # 运行异步批量处理
-            results = await extractor.process_batch_async(urls, target_elements)
+            results = await extractor.process_batch_async(urls, target_elements, keep_results=True)
             
             # 计算统计信息
             end_time = time.time()
@@ -187,8 +202,14 @@ class PerformanceTester:
                 "cpu_usage": 0
             }
     
-    async def run_comparison_test(self, num_urls: int = 10) -> Dict[str, Any]:
-        """运行对比测试"""
+    async def run_comparison_test(self, num_urls: int = 10, parallel: bool = False) -> Dict[str, Any]:
+        """
+        运行对比测试
+        
+        Args:
+            num_urls: 测试URL数量
+            parallel: 是否同时运行两种模式（同步测试放到线程中），总耗时减半，但CPU和内存统计会相互影响
+        """
         print(f"开始性能对比测试，测试URL数量: {num_urls}")
         print("=" * 60)
         
@@ -196,11 +217,18 @@ class PerformanceTester:
         async_config = self.create_test_config(num_urls, use_async=True)
         sync_config = self.create_test_config(num_urls, use_async=False)
         
-        # 运行异步测试
-        async_result = await self.run_async_test(async_config)
-        
-        # 运行同步测试
-        sync_result = self.run_sync_test(sync_config)
+        if parallel:
+            # 两种模式同时运行：同步测试在线程中执行，不阻塞事件循环
+            async_result, sync_result = await asyncio.gather(
+                self.run_async_test(async_config),
+                asyncio.to_thread(self.run_sync_test, sync_config)
+            )
+        else:
+            # 运行异步测试
+            async_result = await self.run_async_test(async_config)
+            
+            # 运行同步测试
+            sync_result = self.run_sync_test(sync_config)
         
         # 生成对比报告
         comparison = self.generate_comparison_report(async_result, sync_result)
@@ -210,8 +238,8 @@ class PerformanceTester:
                 "num_urls": num_urls,
                 "test_time": datetime.now().isoformat(),
                 "system_info": {
-                    "cpu_count": psutil.cpu_count(),
-                    "memory_total": psutil.virtual_memory().total / 1024 / 1024 / 1024,
+                    "cpu_count": self._psutil.cpu_count(),
+                    "memory_total": self._psutil.virtual_memory().total / 1024 / 1024 / 1024,
                     "platform": sys.platform
                 }
             },
@@ -302,8 +330,8 @@ class PerformanceTester:
     def save_test_results(self, results: Dict[str, Any], output_file: str = "performance_test_results.json"):
         """保存测试结果到文件"""
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
+            with open(output_file, 'wb') as f:
+                f.write(_json_dumps(results))
             print(f"测试结果已保存到: {output_file}")
         except Exception as e:
             print(f"保存测试结果失败: {str(e)}")
@@ -317,6 +345,7 @@ async def main():
     parser.add_argument('--urls', type=int, default=10, help='测试URL数量')
     parser.add_argument('--output', type=str, default='performance_test_results.json', help='输出文件路径')
     parser.add_argument('--no-save', action='store_true', help='不保存测试结果')
+    parser.add_argument('--parallel', action='store_true', help='同时运行同步和异步测试（更快，但资源统计会相互影响）')
     
     args = parser.parse_args()
     
@@ -328,7 +357,7 @@ async def main():
     
     # 运行测试
     tester = PerformanceTester()
-    results = await tester.run_comparison_test(args.urls)
+    results = await tester.run_comparison_test(args.urls, parallel=args.parallel)
     
     # 打印结果
     tester.print_test_results(results)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+异步XPath提取器测试（不访问网络和LLM API）
+"""
+
+import asyncio
+
+import pytest
+
+from async_xpath_extractor import AsyncXPathExtractor
+
+
+def make_extractor(monkeypatch):
+    monkeypatch.delenv("SILICONFLOW_API_KEY", raising=False)
+    return AsyncXPathExtractor(api_key="")
+
+
+def test_fetch_webpages_sync_runs_async_fetch_and_closes_session(monkeypatch):
+    extractor = make_extractor(monkeypatch)
+    calls = []
+    
+    async def fake_fetch(urls):
+        calls.append(("fetch", list(urls)))
+        return ["tree", ValueError("failed")]
+    
+    async def fake_aclose():
+        calls.append(("aclose",))
+    
+    monkeypatch.setattr(extractor, "fetch_webpages_async", fake_fetch)
+    monkeypatch.setattr(extractor, "aclose", fake_aclose)
+    
+    results = extractor.fetch_webpages_sync(["https://example.com/a", "https://example.com/b"])
+    
+    assert results[0] == "tree"
+    assert isinstance(results[1], ValueError)
+    assert calls == [("fetch", ["https://example.com/a", "https://example.com/b"]), ("aclose",)]
+
+
+def _bad_request(message):
+    import httpx
+    from openai import BadRequestError
+    
+    response = httpx.Response(400, request=httpx.Request("POST", "https://api.example.com/v1/chat/completions"))
+    return BadRequestError(message, response=response, body=None)
+
+
+class _FakeCompletions:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+    
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def make_llm_extractor(monkeypatch, outcomes):
+    import types
+    
+    pytest.importorskip("openai")
+    extractor = AsyncXPathExtractor(api_key="test-key")
+    completions = _FakeCompletions(outcomes)
+    extractor.async_client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+    return extractor, completions
+
+
+def _text_response(content):
+    import types
+    
+    message = types.SimpleNamespace(content=content, tool_calls=None)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+def test_unsupported_tools_falls_back_to_next_mode(monkeypatch):
+    extractor, completions = make_llm_extractor(monkeypatch, [
+        _bad_request("tools is not supported for this model"),
+        _text_response('{"标题": "//h1"}'),
+    ])
+    
+    result = asyncio.run(extractor._request_xpath_dict("任务", ["标题"]))
+    
+    assert result == {"标题": "//h1"}
+    assert "tools" in completions.calls[0]
+    assert completions.calls[1]["response_format"] == {"type": "json_object"}
+
+
+def test_json_parse_error_does_not_fall_back(monkeypatch):
+    extractor, completions = make_llm_extractor(monkeypatch, [
+        _bad_request("Invalid JSON in request body: Expecting value: line 1 column 1 (char 0)"),
+    ])
+    
+    with pytest.raises(Exception):
+        asyncio.run(extractor._request_xpath_dict("任务", ["标题"]))
+    
+    assert len(completions.calls) == 1
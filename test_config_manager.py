@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+配置管理器测试
+"""
+
+import json
+
+import pytest
+
+from config_manager import ConfigManager, _URL_RE
+
+
+@pytest.mark.parametrize("url", [
+    "https://example.com",
+    "http://example.com/path?q=1#frag",
+    "svn+ssh://host/repo",
+])
+def test_url_re_accepts_scheme_and_host(url):
+    assert _URL_RE.fullmatch(url)
+
+
+@pytest.mark.parametrize("url", [
+    "http://?q",
+    "http://#x",
+    "http:///path",
+    "example.com",
+    "1http://example.com",
+])
+def test_url_re_rejects_missing_host(url):
+    assert _URL_RE.fullmatch(url) is None
+
+
+def test_load_config_filters_invalid_urls(tmp_path):
+    urls_file = tmp_path / "urls.txt"
+    urls_file.write_text("# 注释\nhttps://example.com/a\nhttp://?q\n  https://example.com/b  \n", encoding="utf-8")
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({
+        "target_elements": ["标题"],
+        "urls": ["http://#x", "https://example.com/c"],
+        "urls_file": str(urls_file),
+    }), encoding="utf-8")
+    
+    config = ConfigManager().load_config(str(config_file))
+    
+    assert config["urls"] == ["https://example.com/c", "https://example.com/a", "https://example.com/b"]
+
+
+def test_config_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(ConfigManager, "_CACHE_MAX_ENTRIES", 2)
+    monkeypatch.setattr(ConfigManager, "_config_cache", type(ConfigManager._config_cache)())
+    manager = ConfigManager()
+    paths = []
+    for i in range(3):
+        config_file = tmp_path / f"config{i}.json"
+        config_file.write_text(json.dumps({"target_elements": ["标题"], "urls": []}), encoding="utf-8")
+        manager.load_config(str(config_file))
+        paths.append(str(config_file))
+    
+    assert list(ConfigManager._config_cache) == paths[1:]
+
+
+def test_url_file_with_invalid_utf8_reports_line(tmp_path):
+    urls_file = tmp_path / "urls.txt"
+    urls_file.write_bytes(b"https://example.com/a\nhttps://example.com/\xff\n")
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({"target_elements": ["标题"], "urls_file": str(urls_file)}), encoding="utf-8")
+    
+    with pytest.raises(Exception, match="第2行"):
+        ConfigManager().load_config(str(config_file))